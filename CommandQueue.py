@@ -0,0 +1,39 @@
+import threading
+
+class CommandQueue:
+    # Collects control commands from request threads so the render loop can
+    # apply them between frames. A newer command with the same key replaces
+    # the pending one, so a burst of slider updates costs one call per frame.
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.ready = threading.Event()
+
+    def put(self, name, *args, key=None):
+        if key is None:
+            key = name
+        with self.lock:
+            # Re-inserting keeps the pending commands in the order they were last sent
+            self.pending.pop(key, None)
+            self.pending[key] = (name, args)
+            # Set only while commands are pending, apply clears it
+            self.ready.set()
+
+    def wait(self, timeout):
+        # Returns True as soon as a command is pending, False after timeout
+        return self.ready.wait(timeout)
+
+    def apply(self, target):
+        if not self.pending:
+            return
+        with self.lock:
+            pending = self.pending
+            self.pending = {}
+            self.ready.clear()
+        for name, args in pending.values():
+            try:
+                getattr(target, name)(*args)
+            except Exception as e:
+                # A bad command must not end the render loop
+                print("Command {} failed: {!r}".format(name, e))
@@ -0,0 +1,111 @@
+import struct
+import time
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+
+# Bus header: magic, x, y, channels, slots, sequence of the latest frame.
+# Every slot starts with its own sequence and timestamp, followed by the frame.
+# A slot sequence of 0 means the slot is being written.
+bus_header = struct.Struct("<4sIIIIQ")
+slot_header = struct.Struct("<Qd")
+magic = b"SKYB"
+
+def get_slot_size(x, y, channels):
+    return slot_header.size + x * y * channels
+
+def get_frames(memory, x, y, channels, slots):
+    # (x, y, channels) uint8 views of the frames of all slots
+    frames = []
+    for i in range(slots):
+        offset = bus_header.size + i * get_slot_size(x, y, channels) + slot_header.size
+        frames.append(np.ndarray((x, y, channels), dtype=np.uint8, buffer=memory.buf, offset=offset))
+    return frames
+
+class FrameBus:
+    # Publishes display colors into a ring of slots in shared memory, where
+    # any number of local processes can read them with FrameBusReader
+    # without copies and without involving the render loop.
+
+    def __init__(self, name, x, y, channels=3, slots=4) -> None:
+        self.x = x
+        self.y = y
+        self.channels = channels
+        self.slots = slots
+        self.sequence = 0
+        size = bus_header.size + slots * get_slot_size(x, y, channels)
+        try:
+            self.memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by a publisher that did not shut down
+            old = shared_memory.SharedMemory(name=name)
+            old.close()
+            old.unlink()
+            self.memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+        bus_header.pack_into(self.memory.buf, 0, magic, x, y, channels, slots, 0)
+        self.frames = get_frames(self.memory, x, y, channels, slots)
+
+    def publish(self, colors, timestamp=None):
+        sequence = self.sequence + 1
+        offset = bus_header.size + (sequence % self.slots) * get_slot_size(self.x, self.y, self.channels)
+        slot_header.pack_into(self.memory.buf, offset, 0, 0)
+        self.frames[sequence % self.slots][:] = colors
+        slot_header.pack_into(self.memory.buf, offset, sequence, time.time() if timestamp is None else timestamp)
+        struct.pack_into("<Q", self.memory.buf, bus_header.size - 8, sequence)
+        self.sequence = sequence
+
+    def close(self):
+        self.frames = None
+        self.memory.close()
+        self.memory.unlink()
+
+class FrameBusReader:
+    # Reads frames a FrameBus publishes, from any local process
+
+    def __init__(self, name) -> None:
+        self.memory = shared_memory.SharedMemory(name=name)
+        # Only the publisher removes the bus, not the tracker of this process
+        resource_tracker.unregister(self.memory._name, "shared_memory")
+        tag, self.x, self.y, self.channels, self.slots, _ = bus_header.unpack_from(self.memory.buf, 0)
+        if tag != magic:
+            raise ValueError("Shared memory {} is not a frame bus".format(name))
+        self.frames = get_frames(self.memory, self.x, self.y, self.channels, self.slots)
+
+    def get_sequence(self):
+        # Sequence of the latest frame, 0 before the first one
+        return struct.unpack_from("<Q", self.memory.buf, bus_header.size - 8)[0]
+
+    def get_slot(self, sequence):
+        offset = bus_header.size + (sequence % self.slots) * get_slot_size(self.x, self.y, self.channels)
+        return slot_header.unpack_from(self.memory.buf, offset)
+
+    def get_latest(self):
+        # (sequence, timestamp, frame) of the latest frame without copying it,
+        # or None before the first frame. The frame stays valid until the
+        # publisher comes around to its slot again, which is_valid tells.
+        while True:
+            sequence = self.get_sequence()
+            if sequence == 0:
+                return None
+            slot_sequence, timestamp = self.get_slot(sequence)
+            # Otherwise the publisher has already come around again
+            if slot_sequence == sequence:
+                return sequence, timestamp, self.frames[sequence % self.slots]
+
+    def is_valid(self, sequence):
+        return self.get_slot(sequence)[0] == sequence
+
+    def read(self, out):
+        # Copies the latest frame into out and returns its (sequence,
+        # timestamp), retrying if it was overwritten while copying
+        while True:
+            latest = self.get_latest()
+            if latest is None:
+                return None
+            sequence, timestamp, frame = latest
+            out[:] = frame
+            if self.is_valid(sequence):
+                return sequence, timestamp
+
+    def close(self):
+        self.frames = None
+        self.memory.close()
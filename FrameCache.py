@@ -0,0 +1,98 @@
+import hashlib
+import mmap
+import os
+import struct
+import numpy as np
+
+class FramePlayback:
+    # Plays a pre-rendered period straight out of a memory mapped frame file
+
+    def __init__(self, key, path) -> None:
+        self.key = key
+        with open(path, "rb") as file:
+            self.mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        _, self.frames, self.x, self.y, self.period = FrameCache.header.unpack_from(self.mm)
+        self.data = np.frombuffer(self.mm, dtype=np.uint8, offset=FrameCache.header.size)
+        self.data = self.data.reshape(self.frames, self.x, self.y, 3)
+
+    def get(self, t):
+        index = int((t % self.period) / self.period * self.frames) % self.frames
+        return self.data[index]
+
+class FrameCache:
+    # Renders one period of a periodic mode into a file of uint8 rgb frames,
+    # keyed on the mode, geometry and the parameters that change its image.
+    # Frames are dt apart whatever dt the live generator runs at, which
+    # changes with the frame rate. The files are kept to max_bytes in total,
+    # the least recently played are deleted first.
+    header = struct.Struct("<4sIIId")
+    magic = b"SKYF"
+
+    def __init__(self, directory, dt, max_bytes=1 << 30) -> None:
+        self.directory = directory
+        self.dt = dt
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def get_key(self, generator):
+        if generator.get_period() is None:
+            return None
+        description = repr((type(generator).__name__, generator.x, generator.y, self.dt, generator.get_period(), sorted(generator.get_parameters().items())))
+        return hashlib.sha1(description.encode()).hexdigest()
+
+    def get_path(self, key):
+        return os.path.join(self.directory, key + ".frames")
+
+    def open(self, generator):
+        # Returns a playback for the generator, or None if it has to be rendered live
+        key = self.get_key(generator)
+        if key is None:
+            return None
+        try:
+            # The modification time marks when a file was last played
+            os.utime(self.get_path(key))
+            return FramePlayback(key, self.get_path(key))
+        except FileNotFoundError:
+            # Not rendered yet, or just evicted
+            return None
+
+    def get_frames(self, generator):
+        return max(1, int(np.ceil(generator.get_period() / self.dt)))
+
+    def get_size(self, generator):
+        # Bytes of the file render writes for the generator
+        return self.header.size + self.get_frames(generator) * generator.x * generator.y * 3
+
+    def evict(self, keep):
+        # Deletes the least recently played files beyond max_bytes, except keep
+        paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".frames")]
+        files = sorted((os.stat(path).st_mtime, os.path.getsize(path), path) for path in paths)
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= self.max_bytes:
+                break
+            if path != keep:
+                os.remove(path)
+                total -= size
+
+    def render(self, generator, display):
+        # display converts a SkyFrame into (x, y, 3) uint8 colors.
+        # A fresh generator is used so the live one keeps its state.
+        # Returns None for a period that alone would not fit in max_bytes.
+        if self.get_size(generator) > self.max_bytes:
+            return None
+        key = self.get_key(generator)
+        period = generator.get_period()
+        renderer = type(generator)(generator.x, generator.y, self.dt)
+        renderer.set_parameters(generator.get_parameters())
+        frames = self.get_frames(generator)
+        path = self.get_path(key)
+        temp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(temp_path, "wb") as file:
+            file.write(self.header.pack(self.magic, frames, generator.x, generator.y, period))
+            for i in range(frames):
+                frame = renderer.generate(i * period / frames, i)
+                file.write(display(frame).tobytes())
+        os.replace(temp_path, path)
+        self.evict(path)
+        return FramePlayback(key, path)
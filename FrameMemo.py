@@ -0,0 +1,59 @@
+from collections import OrderedDict
+
+class FrameMemo:
+    # Memoizes rendered frames of periodic generators that are pure functions
+    # of t. Frames are keyed on the generator, its parameters and the phase of
+    # t within the period quantized to phase_step, and evicted least recently
+    # used first once they take more than max_bytes. Without a period the
+    # phase never repeats, so such frames are not kept at all.
+
+    def __init__(self, max_bytes, phase_step) -> None:
+        self.max_bytes = max_bytes
+        self.phase_step = phase_step
+        self.frames = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get_phase(self, generator, t):
+        # The end of the period rounds to its start, not to a key of its own
+        steps = max(1, round(generator.get_period() / self.phase_step))
+        return round(t % generator.get_period() / self.phase_step) % steps
+
+    def get_key(self, generator, phase):
+        parameters = tuple(sorted(generator.get_parameters().items()))
+        return (type(generator).__name__, id(generator), generator.x, generator.y, parameters, phase)
+
+    def generate(self, generator, t, it):
+        if not generator.is_pure() or generator.get_period() is None:
+            return generator.generate(t, it)
+        phase = self.get_phase(generator, t)
+        key = self.get_key(generator, phase)
+        frame = self.frames.get(key)
+        if frame is not None:
+            self.frames.move_to_end(key)
+            self.hits += 1
+            return frame
+        self.misses += 1
+        # Render at the quantized phase so every frame under a key is the same
+        frame = generator.generate(phase * self.phase_step, it)
+        # Cached frames are shared, nothing may draw into them afterwards
+        frame.data.flags.writeable = False
+        self.frames[key] = frame
+        self.bytes += frame.data.nbytes
+        while self.bytes > self.max_bytes and self.frames:
+            _, old = self.frames.popitem(last=False)
+            self.bytes -= old.data.nbytes
+        return frame
+
+    def clear(self):
+        self.frames.clear()
+        self.bytes = 0
+
+    def get_stats(self):
+        return {
+            "frames": len(self.frames),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,37 @@
+import queue
+import threading
+
+class FramePipeline:
+    # Hands rendered frames from the render loop to a separate output thread,
+    # so frame N+1 is rendered while frame N is being clocked out.
+    # At most depth frames wait for output; put() blocks beyond that, which
+    # limits the render stage to the pace of the output stage.
+
+    def __init__(self, output, depth=1) -> None:
+        self.output = output
+        self.frames = queue.Queue(maxsize=depth)
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.output_loop, daemon=True)
+            self.thread.start()
+
+    def put(self, frame):
+        self.frames.put(frame)
+
+    def flush(self):
+        # Blocks until every frame handed over so far has been output
+        self.frames.join()
+
+    def output_loop(self):
+        while True:
+            frame = self.frames.get()
+            try:
+                self.output(frame)
+            except Exception as e:
+                # One failed frame, e.g. a write error of the backend, must
+                # not end the thread, or put() would block for good
+                print("Frame output failed:", repr(e))
+            finally:
+                self.frames.task_done()
@@ -0,0 +1,30 @@
+class FrameRateGovernor:
+    # Picks the frame period of the render loop between min_fps and max_fps.
+    # Modes whose animation does not depend on how many frames are drawn may
+    # run at the rate they ask for, and at idle_fps once the LEDs have not
+    # changed for idle_after seconds. Any change brings the rate back at once.
+
+    def __init__(self, max_fps=60, min_fps=10, idle_fps=2, idle_after=2) -> None:
+        self.max_fps = max_fps
+        self.min_fps = min_fps
+        self.idle_fps = idle_fps
+        self.idle_after = idle_after
+        self.last_change = None
+
+    def reset(self):
+        self.last_change = None
+
+    def is_idle(self, t):
+        return t - self.last_change >= self.idle_after
+
+    def update(self, generator, t, changed):
+        # Returns the period of the next frame; changed tells whether the
+        # last frame output changed the LEDs
+        if changed or self.last_change is None:
+            self.last_change = t
+        if not generator.is_adaptive():
+            return 1 / self.max_fps
+        if self.is_idle(t):
+            return 1 / self.idle_fps
+        rate = generator.get_frame_rate() or self.max_fps
+        return 1 / min(max(rate, self.min_fps), self.max_fps)
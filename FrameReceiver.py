@@ -0,0 +1,90 @@
+import os
+import socket
+import struct
+import threading
+import numpy as np
+
+class FrameReceiver:
+    # Receives frames rendered elsewhere as DDP packets, on a UDP port for an
+    # address of (host, port) or on a Unix datagram socket for a path.
+    # Packets are decoded straight into a preallocated frame, which becomes
+    # the latest frame when a packet with the push flag arrives. Packets of a
+    # frame older than the one being received are dropped.
+    header = struct.Struct(">BBBBIH")
+
+    def __init__(self, size, address) -> None:
+        # size is the frame size in bytes
+        self.size = size
+        self.receiving = np.zeros(size, dtype=np.uint8)
+        self.latest = np.zeros(size, dtype=np.uint8)
+        self.lock = threading.Lock()
+        self.sequence = 0
+        self.received_frames = 0
+        self.dropped_packets = 0
+        if isinstance(address, str):
+            if os.path.exists(address):
+                os.remove(address)
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        else:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(address)
+        self.running = True
+        self.thread = threading.Thread(target=self.receive_loop, daemon=True)
+        self.thread.start()
+
+    def receive_loop(self):
+        packet = bytearray(65536)
+        view = memoryview(packet)
+        while self.running:
+            try:
+                n = self.socket.recv_into(packet)
+            except OSError:
+                # Closed
+                return
+            if not self.running:
+                return
+            self.handle_packet(view[:n])
+
+    def is_stale(self, sequence):
+        # 4 bit sequence numbers, 0 means the sender does not number packets.
+        # Up to half the range behind the current frame counts as older.
+        if sequence == 0 or self.sequence == 0:
+            return False
+        return 8 <= (sequence - self.sequence) % 16 <= 15
+
+    def handle_packet(self, packet):
+        if len(packet) < self.header.size:
+            self.dropped_packets += 1
+            return
+        flags, sequence, _, _, offset, length = self.header.unpack_from(packet)
+        # Only version 1 packets carry pixel data
+        if flags & 0xC0 != 0x40 or self.is_stale(sequence):
+            self.dropped_packets += 1
+            return
+        self.sequence = sequence
+        data = packet[self.header.size:self.header.size + length]
+        stop = min(offset + len(data), self.size)
+        if offset < stop:
+            self.receiving[offset:stop] = np.frombuffer(data, dtype=np.uint8, count=stop - offset)
+        if flags & 0x01:
+            # Copied rather than swapped, so senders may update just a part
+            with self.lock:
+                self.latest[:] = self.receiving
+            self.received_frames += 1
+
+    def read(self, out):
+        # Copies the latest frame into out, a (size,) or reshaped uint8 array
+        with self.lock:
+            out.reshape(-1)[:] = self.latest
+
+    def close(self):
+        # Closing alone does not wake the thread blocked in recv_into, which
+        # keeps the address bound, shutting down does
+        self.running = False
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            # Datagram sockets are not connected, they wake up all the same
+            pass
+        self.thread.join()
+        self.socket.close()
@@ -0,0 +1,70 @@
+import time
+from collections import deque
+import numpy as np
+
+class FrameScheduler:
+    # Paces the render loop on absolute frame deadlines of a monotonic clock,
+    # so render and show() time is absorbed instead of added to the period.
+
+    def __init__(self, dt, history=120) -> None:
+        self.dt = dt
+        self.frame_times = deque(maxlen=history)
+        self.dropped_frames = 0
+        self.late_frames = 0
+        self.frames = 0
+        self.reset()
+
+    def reset(self, t=0):
+        # Animation time continues at t from now on
+        now = time.monotonic()
+        self.epoch = now - t
+        self.deadline = now
+        self.last_frame = None
+
+    def time(self):
+        return time.monotonic() - self.epoch
+
+    def wait(self, sleep=None):
+        # sleep(seconds) may return True when it was woken early, then the
+        # next frame starts right away and later deadlines count from now
+        self.deadline += self.dt
+        now = time.monotonic()
+        if now < self.deadline:
+            if (sleep or time.sleep)(self.deadline - now):
+                self.deadline = time.monotonic()
+        else:
+            # Running late: start right away, and give up on every deadline
+            # that has already fully passed instead of trying to catch up
+            missed = int((now - self.deadline) / self.dt)
+            self.deadline += missed * self.dt
+            self.dropped_frames += missed
+            self.late_frames += 1
+        self.record_frame()
+
+    def record_frame(self):
+        now = time.monotonic()
+        if self.last_frame is not None:
+            self.frame_times.append(now - self.last_frame)
+        self.last_frame = now
+        self.frames += 1
+
+    def get_fps(self):
+        if len(self.frame_times) == 0:
+            return 0
+        return len(self.frame_times) / sum(self.frame_times)
+
+    def get_jitter(self):
+        # Standard deviation of the achieved frame period in seconds
+        if len(self.frame_times) < 2:
+            return 0
+        return float(np.std(self.frame_times))
+
+    def get_stats(self):
+        return {
+            "fps": self.get_fps(),
+            "target_fps": 1 / self.dt,
+            "jitter": self.get_jitter(),
+            "frames": self.frames,
+            "dropped_frames": self.dropped_frames,
+            "late_frames": self.late_frames,
+        }
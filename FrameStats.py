@@ -0,0 +1,67 @@
+from bisect import bisect_left
+import numpy as np
+
+class StageHistogram:
+    # Durations of one pipeline stage: the last window samples for percentiles
+    # plus cumulative bucket counts in the form Prometheus expects
+    buckets = [0.00025, 0.0005, 0.001, 0.002, 0.004, 0.008, 0.016, 0.033, 0.066, 0.133, 0.5]
+
+    def __init__(self, window=600) -> None:
+        self.samples = np.zeros(window)
+        self.index = 0
+        self.filled = 0
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def record(self, seconds):
+        self.samples[self.index] = seconds
+        self.index = (self.index + 1) % len(self.samples)
+        self.filled = min(self.filled + 1, len(self.samples))
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def get_summary(self):
+        if self.filled == 0:
+            return {"count": self.count}
+        p50, p90, p99 = np.percentile(self.samples[:self.filled], [50, 90, 99])
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50_ms": p50 * 1000,
+            "p90_ms": p90 * 1000,
+            "p99_ms": p99 * 1000,
+            "max_ms": float(self.samples[:self.filled].max() * 1000),
+        }
+
+class FrameStats:
+    # Per stage frame timings, cheap enough to stay enabled permanently
+    stages = ["render", "brightness", "format", "show"]
+
+    def __init__(self, window=600) -> None:
+        self.histograms = {stage: StageHistogram(window) for stage in self.stages}
+
+    def record(self, stage, seconds):
+        self.histograms[stage].record(seconds)
+
+    def get_summary(self):
+        return {stage: histogram.get_summary() for stage, histogram in self.histograms.items()}
+
+    def to_prometheus(self, gauges):
+        # gauges are additional plain values, e.g. the scheduler counters
+        lines = [
+            "# HELP sky_stage_seconds Time spent per frame in each pipeline stage",
+            "# TYPE sky_stage_seconds histogram",
+        ]
+        for stage, histogram in self.histograms.items():
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ["+Inf"], histogram.counts):
+                cumulative += count
+                lines.append('sky_stage_seconds_bucket{{stage="{}",le="{}"}} {}'.format(stage, bound, cumulative))
+            lines.append('sky_stage_seconds_sum{{stage="{}"}} {}'.format(stage, histogram.sum))
+            lines.append('sky_stage_seconds_count{{stage="{}"}} {}'.format(stage, histogram.count))
+        for name, value in gauges.items():
+            lines.append("# TYPE sky_{} gauge".format(name))
+            lines.append("sky_{} {}".format(name, value))
+        return "\n".join(lines) + "\n"
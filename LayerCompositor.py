@@ -0,0 +1,81 @@
+import numpy as np
+from SkyFrame import channel_max
+
+# Blend modes, applied in place to the (x, y, 3) colors below a layer.
+# colors are the straight colors of the layer, coverage its alpha times opacity.
+
+def blend_over(base, colors, coverage):
+    base += coverage * (colors - base)
+
+def blend_add(base, colors, coverage):
+    base += coverage * colors
+    np.minimum(base, 255, out=base)
+
+def blend_multiply(base, colors, coverage):
+    base *= 1 + coverage * (colors / 255 - 1)
+
+def blend_max(base, colors, coverage):
+    np.maximum(base, coverage * colors, out=base)
+
+blend_modes = {
+    "over": blend_over,
+    "add": blend_add,
+    "multiply": blend_multiply,
+    "max": blend_max,
+}
+
+class Layer:
+    # One generator in a layer stack. With fps set the layer is only
+    # rendered that often and its last frame is reused in between.
+
+    def __init__(self, generator, blend="over", opacity=1, fps=None) -> None:
+        if blend not in blend_modes:
+            raise ValueError("Unknown blend mode: {}".format(blend))
+        self.generator = generator
+        self.blend = blend_modes[blend]
+        self.opacity = opacity
+        self.fps = fps
+        self.colors = None
+        self.coverage = None
+        self.rendered_at = None
+        self.it = 0
+
+    def is_due(self, t, it):
+        if self.rendered_at is None or it == 0 or self.fps is None:
+            return True
+        # Also when time went backwards, e.g. after a mode reset
+        return not 0 <= t - self.rendered_at < 1 / self.fps
+
+    def update(self, t, it):
+        if not self.is_due(t, it):
+            return
+        if it == 0:
+            self.it = 0
+        frame = self.generator.generate(t, self.it)
+        self.it += 1
+        self.rendered_at = t
+        # Straight colors as the LEDs would show them at full intensity
+        rgb = frame.rgb
+        peak = channel_max(rgb)[..., None]
+        self.colors = np.divide(rgb * 255, peak, out=np.zeros_like(rgb), where=peak > 0)
+        self.coverage = frame.alpha[..., None] * self.opacity
+
+class LayerCompositor:
+    # Combines layers bottom to top over black into one frame
+
+    def __init__(self) -> None:
+        self.colors = None
+
+    def composite(self, layers, t, it, frame):
+        if self.colors is None or self.colors.shape != frame.rgb.shape:
+            self.colors = np.zeros(frame.rgb.shape, dtype=np.float32)
+        colors = self.colors
+        colors.fill(0)
+        for layer in layers:
+            layer.update(t, it)
+            layer.blend(colors, layer.colors, layer.coverage)
+        # The output stage scales colors to full intensity and multiplies
+        # by alpha, so the peak goes into alpha to show exactly these colors
+        frame.rgb[:] = colors
+        frame.alpha[:] = channel_max(colors) / 255
+        return frame
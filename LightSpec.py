@@ -1,14 +1,57 @@
+import numpy as np
+
 class LightSpec:
+    # Compatibility shim for code written against the old per-pixel grid.
+    # The values live in a 4 element array which may be a view into a SkyFrame,
+    # so writes through a LightSpec end up in the frame buffer.
 
     def __init__(self, ca) -> None:
-        self.r, self.g, self.b, self.a = ca
-        
+        self.data = np.array(ca, dtype=np.float32)
+
+    @classmethod
+    def view(cls, data):
+        spec = cls.__new__(cls)
+        spec.data = data
+        return spec
+
+    @property
+    def r(self):
+        return self.data[0]
+
+    @r.setter
+    def r(self, value):
+        self.data[0] = value
+
+    @property
+    def g(self):
+        return self.data[1]
+
+    @g.setter
+    def g(self, value):
+        self.data[1] = value
+
+    @property
+    def b(self):
+        return self.data[2]
+
+    @b.setter
+    def b(self, value):
+        self.data[2] = value
+
+    @property
+    def a(self):
+        return self.data[3]
+
+    @a.setter
+    def a(self, value):
+        self.data[3] = value
+
     def set_color(self, color):
-        self.r, self.g, self.b, self.a = color
+        self.data[:] = color
 
     def set_color_ci(self, color, intensity):
-        self.r, self.g, self.b = color
-        self.a = intensity
+        self.data[:3] = color
+        self.data[3] = intensity
 
     def to_string(self):
-        return "({},{},{},{})".format(self.r, self.g, self.b, self.a)
\ No newline at end of file
+        return "({},{},{},{})".format(self.r, self.g, self.b, self.a)
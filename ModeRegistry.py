@@ -0,0 +1,54 @@
+import inspect
+
+class ModeRegistry:
+    # Knows the generator classes that can be selected as modes. Modes are
+    # listed from class metadata; generators are only built when needed.
+
+    # Classes the old module scan numbered by class name. Modes added since
+    # get the ids after theirs in the order they are registered, so the id
+    # of an existing mode never changes.
+    legacy = {"AngleLineGenerator", "BandGenerator", "CircleGenerator", "CircularGenerator",
+              "ColorPulseGenerator", "DVDGenerator", "DiskGenerator", "DropGenerator",
+              "HeartGenerator", "LightHouseGenerator", "LineGenerator", "LinearGenerator",
+              "MetronomeGenerator", "MonotoneBlinkGenerator", "MultiColorLineGenerator",
+              "PerlinGenerator", "RingGenerator", "SkyGenerator", "SpiralGenerator",
+              "SquareGenerator", "StarGenerator", "WaveGenerator"}
+
+    def __init__(self) -> None:
+        self.classes = {}
+
+    def register(self, cls):
+        # Usable as a class decorator
+        self.classes[cls.__name__] = cls
+        return cls
+
+    def scan(self, module):
+        # Registers every *Generator class of a module that was not registered explicitly
+        for name, cls in inspect.getmembers(module, inspect.isclass):
+            if name[-9::] == "Generator":
+                self.register(cls)
+
+    def get_classes(self):
+        names = [name for name in sorted(self.classes) if name in self.legacy]
+        names += [name for name in self.classes if name not in self.legacy]
+        return [self.classes[name] for name in names]
+
+    def get_class(self, id):
+        classes = self.get_classes()
+        # Negative ids would count from the end
+        if not 0 <= id < len(classes):
+            raise ValueError("Unknown mode id: {}".format(id))
+        return classes[id]
+
+    def get_modes(self):
+        return [{"name": cls.name, "id": idx} for idx, cls in enumerate(self.get_classes())]
+
+    def create(self, id, x, y, dt, warm_up=False):
+        generator = self.get_class(id)(x, y, dt)
+        if warm_up:
+            # Render one throwaway frame so caches are built before it is shown
+            generator.generate(0, 0)
+        return generator
+
+modes = ModeRegistry()
+register = modes.register
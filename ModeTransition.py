@@ -0,0 +1,32 @@
+import numpy as np
+
+class CrossFade:
+    # Fades from the outgoing mode to the incoming one over duration seconds.
+    # The outgoing mode keeps running on its own clock, and both are blended
+    # as the colors the LEDs show, so a pre-rendered mode mixes in as well.
+
+    def __init__(self, generator, playback, t, it, duration, x, y) -> None:
+        self.generator = generator
+        self.playback = playback
+        # Time and frame count of the outgoing mode when the fade started
+        self.t = t
+        self.it = it
+        self.duration = duration
+        self.colors = np.zeros((x, y, 3), dtype=np.float32)
+
+    def get_weight(self, t):
+        # Share of the incoming mode, t is the time of the incoming mode
+        return min(1, t / self.duration)
+
+    def is_done(self, t):
+        return t >= self.duration
+
+    def get_outgoing_time(self, t, it):
+        return (self.t + t, self.it + it)
+
+    def blend(self, outgoing, incoming, weight):
+        # outgoing and incoming are (x, y, 3) uint8 display colors
+        np.subtract(incoming, outgoing, out=self.colors, dtype=np.float32)
+        self.colors *= weight
+        self.colors += outgoing
+        return self.colors.astype(np.uint8)
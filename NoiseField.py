@@ -0,0 +1,122 @@
+import numpy as np
+
+class NoiseField:
+    # Gradient (Perlin) noise evaluated for whole coordinate arrays at once.
+    # frequency scales the coordinates, like the octaves argument of
+    # perlin_noise.PerlinNoise; octaves adds finer layers on top.
+
+    def __init__(self, seed=None, frequency=1, octaves=1, persistence=0.5, size=256) -> None:
+        # size is the lattice period and must be a power of two. Without a
+        # seed one is drawn from np.random, so seeding that reproduces the field.
+        if seed is None:
+            seed = np.random.randint(2 ** 31)
+        rng = np.random.default_rng(seed)
+        self.frequency = frequency
+        self.octaves = octaves
+        self.persistence = persistence
+        self.size = size
+        self.mask = size - 1
+        # Doubled so a hash plus a cell index never needs wrapping
+        self.perm = np.tile(rng.permutation(size), 2)
+        angles = rng.uniform(0, 2 * np.pi, size)
+        self.gradients2 = np.stack([np.cos(angles), np.sin(angles)], axis=-1)
+        gradients3 = rng.normal(size=(size, 3))
+        self.gradients3 = gradients3 / np.linalg.norm(gradients3, axis=-1, keepdims=True)
+
+    def fade(self, t):
+        return t * t * t * (t * (t * 6 - 15) + 10)
+
+    def gradient_noise2(self, x, y):
+        xf = np.floor(x)
+        yf = np.floor(y)
+        xi = xf.astype(np.int64) & self.mask
+        yi = yf.astype(np.int64) & self.mask
+        xf = x - xf
+        yf = y - yf
+        u = self.fade(xf)
+        v = self.fade(yf)
+        # Row hashes are shared by the two corners on each side
+        hx = (self.perm[xi], self.perm[xi + 1])
+
+        def corner(dx, dy):
+            g = self.gradients2[self.perm[hx[dx] + yi + dy]]
+            return g[..., 0] * (xf - dx) + g[..., 1] * (yf - dy)
+
+        n00 = corner(0, 0)
+        n01 = corner(0, 1)
+        bottom = n00 + u * (corner(1, 0) - n00)
+        top = n01 + u * (corner(1, 1) - n01)
+        return bottom + v * (top - bottom)
+
+    def gradient_noise3(self, x, y, z, tile_z=None):
+        # With tile_z the noise repeats every tile_z units of z
+        xf = np.floor(x)
+        yf = np.floor(y)
+        zf = np.floor(z)
+        xi = xf.astype(np.int64) & self.mask
+        yi = yf.astype(np.int64) & self.mask
+        zi = zf.astype(np.int64)
+        xf = x - xf
+        yf = y - yf
+        zf = z - zf
+        u = self.fade(xf)
+        v = self.fade(yf)
+        w = self.fade(zf)
+        if tile_z is None:
+            zi = (zi & self.mask, (zi + 1) & self.mask)
+        else:
+            zi = (zi % tile_z, (zi + 1) % tile_z)
+        hx = (self.perm[xi], self.perm[xi + 1])
+
+        def corner(dx, dy, dz):
+            g = self.gradients3[self.perm[self.perm[hx[dx] + yi + dy] + zi[dz]]]
+            return g[..., 0] * (xf - dx) + g[..., 1] * (yf - dy) + g[..., 2] * (zf - dz)
+
+        def lerp(a, b, t):
+            return a + t * (b - a)
+
+        front = lerp(lerp(corner(0, 0, 0), corner(1, 0, 0), u), lerp(corner(0, 1, 0), corner(1, 1, 0), u), v)
+        back = lerp(lerp(corner(0, 0, 1), corner(1, 0, 1), u), lerp(corner(0, 1, 1), corner(1, 1, 1), u), v)
+        return lerp(front, back, w)
+
+    def noise2(self, x, y):
+        return self.fractal(lambda f: self.gradient_noise2(np.asarray(x) * f, np.asarray(y) * f))
+
+    def noise3(self, x, y, z, tile_z=None):
+        # tile_z is given in units of z at the base frequency
+        def layer(f):
+            tile = None if tile_z is None else int(round(tile_z * f))
+            return self.gradient_noise3(np.asarray(x) * f, np.asarray(y) * f, np.asarray(z) * f, tile)
+        return self.fractal(layer)
+
+    def fractal(self, layer):
+        total = 0
+        amplitude = 1
+        amplitudes = 0
+        frequency = self.frequency
+        for _ in range(self.octaves):
+            total = total + amplitude * layer(frequency)
+            amplitudes += amplitude
+            amplitude *= self.persistence
+            frequency *= 2
+        return total / amplitudes
+
+    def bake(self, x, y, frames, duration):
+        # Pre-renders a (frames, x.shape) volume that loops seamlessly every
+        # duration units of time; x and y are coordinate arrays
+        z = np.arange(frames) * duration / frames
+        volume = self.noise3(x[None], y[None], z[:, None, None], tile_z=duration)
+        return NoiseVolume(volume.astype(np.float32), duration)
+
+class NoiseVolume:
+    # A baked, time looped noise volume sampled per frame
+
+    def __init__(self, volume, duration) -> None:
+        self.volume = volume
+        self.duration = duration
+
+    def sample(self, t):
+        position = (t % self.duration) / self.duration * len(self.volume)
+        i = int(position)
+        blend = position - i
+        return (1 - blend) * self.volume[i % len(self.volume)] + blend * self.volume[(i + 1) % len(self.volume)]
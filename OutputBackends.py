@@ -0,0 +1,278 @@
+from collections import deque
+import socket
+import struct
+import threading
+import uuid
+import numpy as np
+
+class OutputBackend:
+    # Receives formatted frames from LEDController as (n, 3) uint8 colors in
+    # strip order, in the channel order the NeoPixel strip takes them.
+    # Backends that keep the previous frame can take only the changed
+    # pixel ranges of a frame with write_ranges.
+    supports_partial = False
+
+    def __init__(self, n) -> None:
+        self.n = n
+        self.frames = 0
+
+    def write(self, colors):
+        pass
+
+    def write_ranges(self, colors, ranges):
+        # ranges are (start, stop) pixel ranges that differ from the last frame
+        self.write(colors)
+
+    def show(self):
+        self.frames += 1
+
+    def clear(self):
+        self.write(np.zeros((self.n, 3), dtype=np.uint8))
+        self.show()
+
+    def close(self):
+        # Releases files, sockets or pins on shutdown
+        pass
+
+class NeoPixelBackend(OutputBackend):
+
+    def __init__(self, n, pin=None) -> None:
+        # Only importable on the Pi, so imported when the strip is actually used
+        import board
+        import neopixel
+        super().__init__(n)
+        self.pixels = neopixel.NeoPixel(pin or board.D18, n, brightness = 1, auto_write=False)
+        self.byte_order = self.get_byte_order()
+        self.supports_partial = self.byte_order is not None
+
+    def get_byte_order(self):
+        # Order in which the pixel buffer stores the channels of a tuple, so
+        # formatted colors can be copied into it without per pixel reordering
+        byteorder = getattr(self.pixels, "_byteorder", None)
+        if byteorder is None or getattr(self.pixels, "_bpp", None) != 3:
+            return None
+        return np.argsort(byteorder)
+
+    def get_buffer(self):
+        # The raw pixel buffer, if formatted colors can be copied into it
+        buffer = getattr(self.pixels, "_post_brightness_buffer", None)
+        if self.byte_order is None or buffer is None or self.pixels.brightness != 1:
+            return None
+        return buffer
+
+    def write(self, colors):
+        buffer = self.get_buffer()
+        if buffer is not None:
+            offset = self.pixels._offset
+            buffer[offset:offset + colors.size] = colors[:, self.byte_order].tobytes()
+        else:
+            self.pixels[:] = [tuple(color) for color in colors.tolist()]
+
+    def write_ranges(self, colors, ranges):
+        buffer = self.get_buffer()
+        if buffer is None:
+            return self.write(colors)
+        offset = self.pixels._offset
+        for start, stop in ranges:
+            buffer[offset + 3 * start:offset + 3 * stop] = colors[start:stop, self.byte_order].tobytes()
+
+    def show(self):
+        super().show()
+        self.pixels.show()
+
+    def clear(self):
+        self.pixels.fill((0,0,0))
+        self.show()
+
+    def close(self):
+        self.pixels.deinit()
+
+class NullBackend(OutputBackend):
+    # Discards every frame, for running the render pipeline headless
+    pass
+
+class CaptureBackend(OutputBackend):
+    # Keeps the last max_frames shown frames in memory
+
+    def __init__(self, n, max_frames=600) -> None:
+        super().__init__(n)
+        self.buffer = np.zeros((n, 3), dtype=np.uint8)
+        self.captured = deque(maxlen=max_frames)
+
+    def write(self, colors):
+        self.buffer[:] = colors
+
+    def show(self):
+        super().show()
+        self.captured.append(self.buffer.copy())
+
+class FileBackend(OutputBackend):
+    # Appends every shown frame as n * 3 raw bytes to a file
+
+    def __init__(self, n, path) -> None:
+        super().__init__(n)
+        self.buffer = np.zeros((n, 3), dtype=np.uint8)
+        self.file = open(path, "wb")
+
+    def write(self, colors):
+        self.buffer[:] = colors
+
+    def show(self):
+        super().show()
+        self.file.write(self.buffer.tobytes())
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+class UDPBackend(OutputBackend):
+    # Streams frames to a network pixel controller. Packets are sent from a
+    # sender thread into preallocated buffers, so the render loop never waits
+    # on the network, and only the latest frame is sent. The last frame is
+    # repeated every keepalive seconds, as receivers fall back to their own
+    # effects when the stream stops, e.g. while unchanged frames are skipped.
+    port = None
+
+    def __init__(self, n, host, port=None, byte_order="RGB", keepalive=1) -> None:
+        super().__init__(n)
+        self.host = host
+        self.port = port or self.port
+        # Colors arrive in strip order (g, r, b), byte_order is the order on the wire
+        self.channels = ["GRB".index(channel) for channel in byte_order]
+        self.keepalive = keepalive
+        self.pending = np.zeros((n, 3), dtype=np.uint8)
+        self.sending = np.zeros(n * 3, dtype=np.uint8)
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.sequence = 0
+        self.sent_frames = 0
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # (packet, writable view of its data, start, stop, address) per packet
+        self.packets = []
+        for start, stop, address, header in self.get_packets():
+            packet = bytearray(header) + bytearray(stop - start)
+            self.packets.append((packet, np.frombuffer(packet, dtype=np.uint8)[len(header):], start, stop, address))
+        self.running = True
+        self.thread = threading.Thread(target=self.send_loop, daemon=True)
+        self.thread.start()
+
+    def get_packets(self):
+        # (start, stop, address, header) per packet, start and stop in bytes of the frame
+        raise NotImplementedError
+
+    def set_sequence(self, packet, sequence):
+        raise NotImplementedError
+
+    def next_sequence(self):
+        return (self.sequence + 1) % 256
+
+    def write(self, colors):
+        with self.lock:
+            self.pending[:] = colors
+
+    def show(self):
+        super().show()
+        self.ready.set()
+
+    def send_loop(self):
+        # Runs once more after close, so a frame shown just before, e.g.
+        # clearing the LEDs, still goes out
+        while self.running:
+            fresh = self.ready.wait(self.keepalive)
+            if fresh:
+                self.ready.clear()
+                with self.lock:
+                    self.sending[:] = self.pending[:, self.channels].ravel()
+            elif self.sent_frames == 0:
+                continue
+            self.send_frame()
+
+    def send_frame(self):
+        self.sequence = self.next_sequence()
+        for packet, data, start, stop, address in self.packets:
+            data[:] = self.sending[start:stop]
+            self.set_sequence(packet, self.sequence)
+            try:
+                self.socket.sendto(packet, address)
+            except OSError:
+                # The receiver may come and go, the next frame tries again
+                pass
+        self.sent_frames += 1
+
+    def close(self):
+        self.running = False
+        self.ready.set()
+        self.thread.join()
+        self.socket.close()
+
+class DDPBackend(UDPBackend):
+    # Distributed Display Protocol, the frame is split into packets by byte
+    # offset and the last packet tells the receiver to show it
+    port = 4048
+    max_pixels = 480
+
+    def get_packets(self):
+        size = self.n * 3
+        for start in range(0, size, self.max_pixels * 3):
+            stop = min(start + self.max_pixels * 3, size)
+            # Version 1, push on the last packet; 8 bit RGB to the default output
+            flags = 0x41 if stop == size else 0x40
+            yield start, stop, (self.host, self.port), struct.pack(">BBBBIH", flags, 0, 0x0B, 1, start, stop - start)
+
+    def next_sequence(self):
+        # 4 bit sequence numbers, 0 means unused
+        return self.sequence % 15 + 1
+
+    def set_sequence(self, packet, sequence):
+        packet[1] = sequence
+
+class E131Backend(UDPBackend):
+    # sACN (E1.31), the frame is split into DMX universes of universe_size
+    # pixels. Without a host every universe goes to its multicast group.
+    port = 5568
+    universe_size = 170
+    header_size = 126
+    sequence_offset = 111
+
+    def __init__(self, n, host=None, universe=1, priority=100, source="SkyLight", **options) -> None:
+        self.universe = universe
+        self.priority = priority
+        self.source = source
+        self.cid = uuid.uuid4().bytes
+        super().__init__(n, host, **options)
+
+    def get_packets(self):
+        size = self.n * 3
+        for i, start in enumerate(range(0, size, self.universe_size * 3)):
+            stop = min(start + self.universe_size * 3, size)
+            universe = self.universe + i
+            host = self.host or "239.255.{}.{}".format(universe >> 8, universe & 0xFF)
+            yield start, stop, (host, self.port), self.get_header(universe, stop - start)
+
+    def get_header(self, universe, slots):
+        length = self.header_size + slots
+        return struct.pack(
+            ">HH12sHI16sHI64sBHBBHHBBHHHB",
+            # Root layer
+            0x0010, 0, b"ASC-E1.17\x00\x00\x00", 0x7000 | (length - 16), 0x00000004, self.cid,
+            # Framing layer, the sequence number is filled in per frame
+            0x7000 | (length - 38), 0x00000002, self.source.encode()[:63], self.priority, 0, 0, 0, universe,
+            # DMP layer, start code 0 followed by the slots
+            0x7000 | (length - 115), 0x02, 0xA1, 0, 1, slots + 1, 0)
+
+    def set_sequence(self, packet, sequence):
+        packet[self.sequence_offset] = sequence
+
+backends = {
+    "neopixel": NeoPixelBackend,
+    "null": NullBackend,
+    "capture": CaptureBackend,
+    "file": FileBackend,
+    "ddp": DDPBackend,
+    "e131": E131Backend,
+}
+
+def create_backend(name, n, **options):
+    if name not in backends:
+        raise ValueError("Unknown output backend '{}', expected one of {}".format(name, ", ".join(backends)))
+    return backends[name](n, **options)
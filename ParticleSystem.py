@@ -0,0 +1,42 @@
+import numpy as np
+
+class ParticleSystem:
+    # Expanding ring particles stored as a struct of arrays with a hard
+    # capacity. Slots are reused in spawn order, so when the system is full
+    # the oldest particle is replaced, and a particle expires simply by its
+    # expiry time passing.
+
+    def __init__(self, capacity) -> None:
+        self.capacity = capacity
+        self.positions = np.zeros((capacity, 2))
+        self.times = np.zeros(capacity)
+        self.speeds = np.zeros(capacity)
+        self.expiry = np.full(capacity, -np.inf)
+        self.colors = np.zeros((capacity, 3), dtype=np.float32)
+        self.next = 0
+
+    def spawn(self, position, t, speed, color, lifetime):
+        i = self.next
+        self.positions[i] = position
+        self.times[i] = t
+        self.speeds[i] = speed
+        self.expiry[i] = t + lifetime
+        self.colors[i] = color
+        self.next = (i + 1) % self.capacity
+
+    def clear(self):
+        self.expiry[:] = -np.inf
+
+    def get_alive(self, t):
+        return np.flatnonzero(self.expiry > t)
+
+    def get_ring_intensities(self, coordinates, t, thickness):
+        # Returns the indices of the living particles and, per particle, the
+        # intensity of its ring at every pixel as a (k, x, y) array
+        alive = self.get_alive(t)
+        radius = (t - self.times[alive]) * self.speeds[alive]
+        dx = coordinates.x_n - self.positions[alive, 0, None, None]
+        dy = coordinates.y_n - self.positions[alive, 1, None, None]
+        distance = np.sqrt(dx ** 2 + dy ** 2)
+        intensity = 1 - np.abs(distance - radius[:, None, None]) / (thickness / 2)
+        return alive, np.maximum(intensity, 0)
@@ -0,0 +1,84 @@
+from functools import lru_cache
+import numpy as np
+
+def interpolation_weights(position, n_in):
+    # (len(position), n_in) matrix that linearly interpolates n_in samples
+    # at the given fractional sample positions
+    position = np.clip(position, 0, n_in - 1)
+    low = np.minimum(np.floor(position).astype(int), max(n_in - 2, 0))
+    blend = position - low
+    weights = np.zeros((len(position), n_in), dtype=np.float32)
+    weights[np.arange(len(position)), low] = 1 - blend
+    if n_in > 1:
+        weights[np.arange(len(position)), low + 1] = blend
+    return weights
+
+def linear_weights(n_in, n_out):
+    # Interpolates n_in samples onto n_out evenly spread positions, both ends aligned
+    return interpolation_weights(np.linspace(0, n_in - 1, n_out), n_in)
+
+def area_weights(n_in, n_out):
+    # (n_out, n_in) matrix averaging the n_in cells each of the n_out larger
+    # cells covers, weighted by how much of them it covers
+    scale = n_in / n_out
+    start = np.arange(n_out)[:, None] * scale
+    cells = np.arange(n_in)[None, :]
+    overlap = np.minimum(cells + 1, start + scale) - np.maximum(cells, start)
+    return (np.maximum(overlap, 0) / scale).astype(np.float32)
+
+def resample_weights(n_in, n_out):
+    # Area averaging when shrinking, linear interpolation between cell centers
+    # when growing
+    if n_in == n_out:
+        return np.eye(n_in, dtype=np.float32)
+    if n_in > n_out:
+        return area_weights(n_in, n_out)
+    return interpolation_weights((np.arange(n_out) + 0.5) * n_in / n_out - 0.5, n_in)
+
+@lru_cache(maxsize=None)
+def sample_window(n_in, n_out, start, n):
+    # (first, count) of the n_in samples that outputs start to start + n mix,
+    # so a tile of the outputs can be resampled from just those samples
+    used = np.flatnonzero((resample_weights(n_in, n_out)[start:start + n] > 0).any(axis=0))
+    return int(used[0]), int(used[-1] + 1 - used[0])
+
+def window_weights(n_in, n_out, start, n):
+    # Weights of outputs start to start + n over their sample_window
+    first, count = sample_window(n_in, n_out, start, n)
+    return resample_weights(n_in, n_out)[start:start + n, first:first + count]
+
+def sparse_weights(weights):
+    # Every output only mixes a few neighbouring inputs, so the matrix is
+    # kept as the (n_out, k) indices and weights of its nonzero entries
+    k = max(1, int((weights > 0).sum(axis=1).max()))
+    indices = np.argsort(weights <= 0, axis=1, kind="stable")[:, :k]
+    return indices, np.take_along_axis(weights, indices, axis=1)
+
+class Resampler:
+    # Maps (w_in, h_in, c) frames onto (w_out, h_out, c), one axis after the
+    # other, as a few weighted gathers per axis; the weights are built once
+    # per geometry. With a tile (x0, y0, w, h) of the outputs, it maps just the
+    # samples of the tile's sample_window onto the tile, giving the same
+    # colors there as resampling the whole frame.
+
+    def __init__(self, w_in, h_in, w_out, h_out, tile=None) -> None:
+        x0, y0, w, h = tile or (0, 0, w_out, h_out)
+        self.weights_x = None if w_in == w_out else sparse_weights(window_weights(w_in, w_out, x0, w))
+        self.weights_y = None if h_in == h_out else sparse_weights(window_weights(h_in, h_out, y0, h))
+
+    def resample_axis(self, data, weights, axis):
+        if weights is None:
+            return data
+        indices, weights = weights
+        shape = (-1, 1, 1) if axis == 0 else (1, -1, 1)
+        result = data.take(indices[:, 0], axis=axis) * weights[:, 0].reshape(shape)
+        for i in range(1, indices.shape[1]):
+            result += data.take(indices[:, i], axis=axis) * weights[:, i].reshape(shape)
+        return result
+
+    def resample(self, data, out=None):
+        result = self.resample_axis(self.resample_axis(data, self.weights_x, 0), self.weights_y, 1)
+        if out is None:
+            return result
+        out[:] = result
+        return out
@@ -0,0 +1,140 @@
+import multiprocessing as mp
+import os
+import random
+from multiprocessing import shared_memory
+import numpy as np
+import SkyGenerator
+from ModeRegistry import modes
+from SkyFrame import SkyFrame
+from led_controller import LEDController
+from FramePipeline import FramePipeline
+
+def get_canvas(buffer, x, y):
+    return np.ndarray((x, y, 4), dtype=np.float32, buffer=buffer.buf)
+
+def render_worker(connection, names, x, y, dt, tile):
+    # Renders one tile of the canvas straight into the shared canvas buffers
+    buffers = [shared_memory.SharedMemory(name=name) for name in names]
+    x0, y0, w, h = tile
+    frames = [SkyFrame(w, h, get_canvas(buffer, x, y)[x0:x0 + w, y0:y0 + h]) for buffer in buffers]
+    generator = None
+    try:
+        while True:
+            command = connection.recv()
+            try:
+                if command[0] == "frame":
+                    _, t, it, index = command
+                    if generator is not None:
+                        generator.generate(t, it, frames[index])
+                elif command[0] == "mode":
+                    _, id, seed, parameters = command
+                    # Every worker seeds alike, so random and stateful modes
+                    # evolve the same way in all tiles
+                    random.seed(seed)
+                    np.random.seed(seed)
+                    generator = modes.create(id, x, y, dt)
+                    generator.set_tile(x0, y0, w, h)
+                    generator.set_parameters(parameters)
+                elif command[0] == "parameters":
+                    generator.set_parameters(command[1])
+                elif command[0] == "stop":
+                    break
+                connection.send(None)
+            except Exception as e:
+                connection.send(repr(e))
+    finally:
+        # Views into the buffers have to go before the buffers can close
+        for frame in frames:
+            frame.data = None
+        for buffer in buffers:
+            buffer.close()
+
+class Panel:
+    # One physical panel or strip showing the x, y, w, h part of the canvas
+
+    def __init__(self, x, y, w, h, output="neopixel", output_options=None) -> None:
+        self.x = x
+        self.y = y
+        self.w = w
+        self.h = h
+        self.sky = LEDController(w, h, output, **(output_options or {}))
+        self.pipeline = FramePipeline(self.sky.set_lights)
+        self.pipeline.start()
+
+class ShardedRenderer:
+    # Renders an x * y canvas in worker processes, one tile each, into a
+    # double buffered shared memory canvas. Panels read their part of the
+    # canvas as views and output it on their own threads, so frames are
+    # never assembled or copied.
+
+    def __init__(self, x, y, dt, panels, workers=None) -> None:
+        self.x = x
+        self.y = y
+        workers = min(workers or os.cpu_count() or 1, x)
+        size = x * y * 4 * np.dtype(np.float32).itemsize
+        self.buffers = [shared_memory.SharedMemory(create=True, size=size) for _ in range(2)]
+        self.canvases = [get_canvas(buffer, x, y) for buffer in self.buffers]
+        for canvas in self.canvases:
+            canvas.fill(0)
+        self.index = 0
+
+        self.panels = [Panel(**panel) for panel in panels]
+        for panel in self.panels:
+            panel.frames = [SkyFrame(panel.w, panel.h, canvas[panel.x:panel.x + panel.w, panel.y:panel.y + panel.h]) for canvas in self.canvases]
+
+        # The canvas is split into bands along x, one per worker
+        bounds = np.linspace(0, x, workers + 1).astype(int)
+        names = [buffer.name for buffer in self.buffers]
+        self.connections = []
+        self.processes = []
+        for x0, x1 in zip(bounds[:-1], bounds[1:]):
+            connection, child = mp.Pipe()
+            process = mp.Process(target=render_worker, args=(child, names, x, y, dt, (int(x0), 0, int(x1 - x0), y)), daemon=True)
+            process.start()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+    def send(self, *command):
+        for connection in self.connections:
+            connection.send(command)
+        for connection in self.connections:
+            error = connection.recv()
+            if error is not None:
+                raise RuntimeError("Render worker failed: " + error)
+
+    def set_mode(self, id, parameters):
+        if not modes.get_class(id).shardable:
+            raise ValueError("{} can not be rendered in tiles".format(modes.get_class(id).name))
+        self.send("mode", id, random.randrange(2 ** 31), parameters)
+
+    def set_parameters(self, parameters):
+        self.send("parameters", parameters)
+
+    def render(self, t, it):
+        index = self.index
+        self.send("frame", t, it, index)
+        for panel in self.panels:
+            # The previous frame lives in the other buffer, which is
+            # rendered into next, so it has to be out first
+            panel.pipeline.flush()
+            panel.pipeline.put(panel.frames[index])
+        self.index = 1 - index
+
+    def clear(self):
+        for panel in self.panels:
+            panel.pipeline.flush()
+            panel.sky.clear_leds()
+
+    def close(self):
+        for connection in self.connections:
+            connection.send(("stop",))
+        for process in self.processes:
+            process.join()
+        for panel in self.panels:
+            panel.sky.close()
+            for frame in panel.frames:
+                frame.data = None
+        self.canvases = []
+        for buffer in self.buffers:
+            buffer.close()
+            buffer.unlink()
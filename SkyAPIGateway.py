@@ -1,19 +1,59 @@
-from SkyController import SkyController
+from SkySupervisor import SkySupervisor
 import time
-from flask import Flask
-import threading
+from flask import Flask, abort
 import json 
+import os
 
 app = Flask(__name__)
-controller = SkyController()
+# SKY_OUTPUT selects the output backend, SKY_OUTPUT_PATH is the target of the
+# file backend and SKY_OUTPUT_HOST the pixel controller of the ddp and e131 backends
+output_options = {}
+if "SKY_OUTPUT_PATH" in os.environ:
+    output_options["path"] = os.environ["SKY_OUTPUT_PATH"]
+if "SKY_OUTPUT_HOST" in os.environ:
+    output_options["host"] = os.environ["SKY_OUTPUT_HOST"]
+# SKY_INGEST is the UDP port or Unix socket path the Network mode receives frames on
+ingest = os.environ.get("SKY_INGEST")
+if ingest is not None and ingest.isdigit():
+    ingest = ("0.0.0.0", int(ingest))
+# SKY_PANELS is a JSON list of {"x", "y", "w", "h", "output", "output_options"} panels,
+# rendered in tiles by SKY_RENDER_WORKERS processes
+panels = json.loads(os.environ["SKY_PANELS"]) if "SKY_PANELS" in os.environ else None
+workers = int(os.environ["SKY_RENDER_WORKERS"]) if "SKY_RENDER_WORKERS" in os.environ else None
+# SKY_TRANSITION is the crossfade between modes in seconds
+transition_duration = float(os.environ.get("SKY_TRANSITION", 0.5))
+# SKY_FRAME_BUS names the shared memory shown frames are published to
+frame_bus = os.environ.get("SKY_FRAME_BUS")
+# SKY_GAMMA is the gamma correction of the LEDs, 1 leaves colors as they are
+gamma = float(os.environ.get("SKY_GAMMA", 1))
+# SKY_OUTPUT_BRIGHTNESS dims the LEDs on top of the brightness of each mode
+output_brightness = float(os.environ.get("SKY_OUTPUT_BRIGHTNESS", 1))
+# The frame rate adapts between SKY_MIN_FPS and SKY_MAX_FPS and drops to
+# SKY_IDLE_FPS while the LEDs do not change
+fps = {name: float(os.environ[key]) for name, key in (("max_fps", "SKY_MAX_FPS"), ("min_fps", "SKY_MIN_FPS"), ("idle_fps", "SKY_IDLE_FPS")) if key in os.environ}
+# Rendering runs in its own process, SKY_RENDER_CPU pins it to a core and
+# SKY_RENDER_PRIORITY gives it that real-time (SCHED_FIFO) priority
+cpu = int(os.environ["SKY_RENDER_CPU"]) if "SKY_RENDER_CPU" in os.environ else None
+priority = int(os.environ["SKY_RENDER_PRIORITY"]) if "SKY_RENDER_PRIORITY" in os.environ else None
+controller = SkySupervisor(cpu=cpu,
+                           priority=priority,
+                           cache_dir=os.environ.get("SKY_FRAME_CACHE"),
+                           cache_bytes=int(os.environ.get("SKY_FRAME_CACHE_BYTES", 1 << 30)),
+                           memo_bytes=int(os.environ.get("SKY_FRAME_MEMO_BYTES", 0)),
+                           output=os.environ.get("SKY_OUTPUT", "neopixel"),
+                           output_options=output_options,
+                           panels=panels,
+                           workers=workers,
+                           transition_duration=transition_duration,
+                           gamma=gamma,
+                           output_brightness=output_brightness,
+                           frame_bus=frame_bus,
+                           ingest_address=ingest,
+                           **fps)
 try:
-    threading.Thread(target=controller.main_loop).start()
-    time.sleep(1)
     controller.start()
 except Exception as e:
     print(e) 
-finally:
-    controller.stop()
 
 class SkyAPIGateway:
     def __init__(self, controller):
@@ -27,12 +67,12 @@ class SkyAPIGateway:
 
     @app.route("/start/")
     def start():
-        controller.start()
+        controller.submit("start")
         return "True"
 
     @app.route("/stop/")
     def stop():
-        controller.stop()
+        controller.submit("stop")
         return "True"
 
     @app.route("/modes/")
@@ -40,27 +80,52 @@ class SkyAPIGateway:
         modes = controller.get_available_modes()
         return json.dumps(modes)
 
-    @app.route("/set/<id>/")
+    @app.route("/set/<int:id>/")
     def set_modes(id):
-        controller.set_mode(int(id))
+        if id >= len(controller.get_available_modes()):
+            abort(404)
+        controller.submit("set_mode", id)
         return "Yes"
 
     @app.route("/color/<int:r>/<int:g>/<int:b>/")
     def set_color(r, g, b):
-        controller.set_color((r, g, b))
+        controller.submit("set_color", (r, g, b))
         return "True"
 
     @app.route("/color/random/")
     def random_mode():
-        controller.set_random_mode(True)
+        controller.submit("set_random_mode", True)
         return "True"
 
     @app.route("/speed/<float:speed>/")
     def set_speed(speed):
-        controller.set_speed(speed)
+        controller.submit("set_speed", speed)
         return "True"
 
     @app.route("/brightness/<float:brightness>/")
     def set_brightness(brightness):
-        controller.set_brightness(brightness)
-        return "True"
\ No newline at end of file
+        controller.submit("set_brightness", brightness)
+        return "True"
+
+    @app.route("/gamma/<float:gamma>/")
+    def set_gamma(gamma):
+        controller.submit("set_gamma", gamma)
+        return "True"
+
+    @app.route("/output_brightness/<float:brightness>/")
+    def set_output_brightness(brightness):
+        controller.submit("set_output_brightness", brightness)
+        return "True"
+
+    @app.route("/render_scale/<float:scale>/")
+    def set_render_scale(scale):
+        controller.submit("set_render_scale", scale)
+        return "True"
+
+    @app.route("/stats/")
+    def stats():
+        return json.dumps(controller.get_frame_stats())
+
+    @app.route("/stats/prometheus/")
+    def stats_prometheus():
+        return controller.get_frame_stats_prometheus(), 200, {"Content-Type": "text/plain; version=0.0.4"}
\ No newline at end of file
@@ -0,0 +1,114 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+import SkyGenerator
+from ModeRegistry import modes
+from SkyFrame import SkyFrame
+from led_controller import LEDController
+
+# 14x14 is the panel in use, 500x500 the size SkyController was laid out for
+default_sizes = [(14, 14), (50, 50), (150, 150), (500, 500)]
+# The Network mode listens on a free port, so runs never clash with a controller
+SkyGenerator.NetworkGenerator.address = ("127.0.0.1", 0)
+stages = ["generate_image", "brightness", "format"]
+
+def summarize(times):
+    times = np.array(times)
+    return {
+        "fps": float(len(times) / times.sum()) if times.sum() > 0 else None,
+        "mean_ms": float(times.mean() * 1000),
+        "p50_ms": float(np.percentile(times, 50) * 1000),
+        "p99_ms": float(np.percentile(times, 99) * 1000),
+    }
+
+def render_frame(generator, led, t, it, times=None):
+    start = time.perf_counter()
+    frame = SkyFrame.wrap(generator.generate_image(t, it, generator.get_blank_frame()))
+    rendered = time.perf_counter()
+    frame = generator.adjust_grid_for_brightness(frame)
+    adjusted = time.perf_counter()
+    led.set_lights(frame)
+    formatted = time.perf_counter()
+    if times is not None:
+        times["generate_image"].append(rendered - start)
+        times["brightness"].append(adjusted - rendered)
+        times["format"].append(formatted - adjusted)
+
+def benchmark_mode(cls, x, y, frames, max_seconds, dt=1/60):
+    generator = cls(x, y, dt)
+    led = LEDController(x, y, "null")
+    # First frame builds the coordinate cache and is not counted
+    render_frame(generator, led, 0, 0)
+    times = {stage: [] for stage in stages}
+    deadline = time.perf_counter() + max_seconds
+    it = 1
+    while it <= frames and time.perf_counter() < deadline:
+        render_frame(generator, led, it * dt, it, times)
+        it += 1
+    result = {stage: summarize(times[stage]) for stage in stages}
+    result["total"] = summarize(np.sum([times[stage] for stage in stages], axis=0))
+    result["frames"] = it - 1
+
+    # Peak memory is measured in a separate short run, tracing slows rendering down
+    tracemalloc.start()
+    for i in range(3):
+        render_frame(generator, led, (it + i) * dt, it + i)
+    result["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    generator.close()
+    return result
+
+def run(sizes, frames, max_seconds, mode_filter=None):
+    results = []
+    for idx, cls in enumerate(modes.get_classes()):
+        if mode_filter and cls.__name__ not in mode_filter and cls.name not in mode_filter:
+            continue
+        for x, y in sizes:
+            result = benchmark_mode(cls, x, y, frames, max_seconds)
+            result.update({"mode": cls.name, "class": cls.__name__, "id": idx, "width": x, "height": y})
+            results.append(result)
+            print("{:28s} {:4d}x{:<4d} {:8.1f} fps  p50 {:8.3f} ms  p99 {:8.3f} ms".format(
+                cls.__name__, x, y, result["total"]["fps"] or 0, result["total"]["p50_ms"], result["total"]["p99_ms"]), file=sys.stderr)
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+def compare(report, baseline):
+    # Ratio of the median total frame time against a baseline report, above 1 is slower
+    old = {(r["class"], r["width"], r["height"]): r for r in baseline["results"]}
+    for r in report["results"]:
+        key = (r["class"], r["width"], r["height"])
+        if key in old:
+            ratio = r["total"]["p50_ms"] / old[key]["total"]["p50_ms"]
+            print("{:28s} {:4d}x{:<4d} {:6.2f}x".format(key[0], key[1], key[2], ratio), file=sys.stderr)
+
+def parse_size(text):
+    x, y = text.lower().split("x")
+    return (int(x), int(y))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark every registered generator headlessly")
+    parser.add_argument("--sizes", nargs="+", type=parse_size, default=default_sizes, help="panel sizes as WxH")
+    parser.add_argument("--frames", type=int, default=300, help="frames per mode and size")
+    parser.add_argument("--max-seconds", type=float, default=10, help="time limit per mode and size")
+    parser.add_argument("--modes", nargs="+", help="class or mode names to run, all by default")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="JSON report of an earlier run to compare against")
+    args = parser.parse_args()
+
+    report = run(args.sizes, args.frames, args.max_seconds, args.modes)
+    if args.baseline:
+        with open(args.baseline) as file:
+            compare(report, json.load(file))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
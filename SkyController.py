@@ -1,89 +1,327 @@
 from led_controller import LEDController
 from SkyGenerator import *
-import time
-import sys
-import inspect
-import copy
+from FrameScheduler import FrameScheduler
+from FramePipeline import FramePipeline
+from ModeRegistry import modes
+from CommandQueue import CommandQueue
+from FrameCache import FrameCache
+from FrameMemo import FrameMemo
+from FrameStats import FrameStats
+from ShardedRenderer import ShardedRenderer
+from ModeTransition import CrossFade
+from FrameBus import FrameBus
+from FrameRateGovernor import FrameRateGovernor
+import numpy as np
+import queue
 import threading
 
 class SkyController:
-    def __init__(self) -> None:
+    def __init__(self, warm_up=False, cache_dir=None, cache_bytes=1 << 30, memo_bytes=0, output="neopixel", output_options=None, panels=None, workers=None, transition_duration=0.5, gamma=1, output_brightness=1, frame_bus=None, ingest_address=None, max_fps=60, min_fps=10, idle_fps=2) -> None:
         w = 500
         h = 500
         x = 14
         y = 14
+        if panels:
+            # The canvas spans all panels, each panel outputs its own part
+            x = max(panel["x"] + panel["w"] for panel in panels)
+            y = max(panel["y"] + panel["h"] for panel in panels)
+            output = "null"
+        self.x = x
+        self.y = y
+        if ingest_address is not None:
+            # Where the Network mode receives frames
+            NetworkGenerator.address = ingest_address
+        # Render a frame of a newly created mode before switching to it
+        self.warm_up = warm_up
+        # Seconds over which a new mode fades in, 0 switches instantly
+        self.transition_duration = transition_duration
+        self.transition = None
 
-        self.sky = LEDController(x, y) 
+        self.sky = LEDController(x, y, output, gamma=gamma, brightness=output_brightness, **(output_options or {}))
+        self.stats = FrameStats()
+        self.sky.stats = self.stats
+        # Adapts the frame rate to the mode and to how much the LEDs change
+        self.governor = FrameRateGovernor(max_fps, min_fps, idle_fps)
+        self.scheduler = FrameScheduler(1 / max_fps)
+        self.pipeline = FramePipeline(self.output_frame)
+        # Shown frames are also published to other processes under this name
+        self.frame_bus = FrameBus(frame_bus, x, y) if frame_bus else None
+        # Commands from the API, applied by the render loop between frames
+        self.commands = CommandQueue()
+        # Periodic modes are pre-rendered into cache_dir, up to cache_bytes,
+        # and played back from there
+        self.frame_cache = FrameCache(cache_dir, 1 / max_fps, cache_bytes) if cache_dir else None
+        self.playback = None
+        # Periods to pre-render, rendered one at a time on one thread once
+        # the parameters have not changed for cache_delay seconds
+        self.cache_requests = queue.Queue()
+        self.cache_delay = 1
+        if self.frame_cache is not None:
+            threading.Thread(target=self.cache_loop, daemon=True).start()
+        # Rendered frames of periodic pure modes are kept up to memo_bytes and reused
+        self.memo = FrameMemo(memo_bytes, 1 / max_fps) if memo_bytes else None
         
         self.reset()
         ### Insert initial Generator here
         self.generator = DropGenerator(x, y, self.dt)
         ###
+        self.generator.stats = self.stats
+        # With panels, frames are rendered in tiles by worker processes
+        self.sharded = None
+        if panels:
+            self.sharded = ShardedRenderer(x, y, self.dt, panels, workers)
+            self.set_gamma(gamma)
+            self.set_output_brightness(output_brightness)
+            self.sharded.set_mode(modes.get_classes().index(type(self.generator)), self.generator.get_parameters())
 
         self.running = False
-        self.available_modes = self.get_available_classes()
-
-    def get_available_classes(self):
-        clsmembers = inspect.getmembers(sys.modules["SkyGenerator"], inspect.isclass)
-        filtered_classes = list(filter(lambda cls: cls[0][-9::] == "Generator", clsmembers))
-        information = {}
-        for idx, item in enumerate(filtered_classes):
-            dict = {}
-            cls = item[1](14, 14, 1/60)
-            name = cls.get_name()
-            dict["name"] = name
-            dict["id"] = idx
-            dict["class"] = cls
-            information[idx] = dict
-        return information
+        self.closed = False
+        # Generators are created the first time their mode is selected
+        self.generators = {}
+
+    def get_generator(self, id):
+        if id not in self.generators:
+            # A mode fading in is warmed up so its first frames come in time.
+            # Sharded, the workers render and this one only holds parameters.
+            warm_up = (self.warm_up or self.transition_duration > 0) and self.sharded is None
+            generator = modes.create(id, self.x, self.y, self.dt, warm_up)
+            generator.stats = self.stats
+            self.generators[id] = generator
+        return self.generators[id]
 
     def get_available_modes(self):
-        l = copy.deepcopy(list(self.available_modes.values()))
-        for item in l:
-            del item["class"]
-        return l
+        return modes.get_modes()
 
     def reset(self):
         self.it = 0
         self.t = 0
-        self.dt = 1/60
+        self.dt = 1 / self.governor.max_fps
+        self.scheduler.dt = self.dt
+        self.scheduler.reset()
+        self.governor.reset()
 
     def set_mode(self, id):
+        if self.sharded is not None and not modes.get_class(id).shardable:
+            # Keeps showing the current mode
+            print("{} can not be shown on panels".format(modes.get_class(id).name))
+            return
+        generator = self.get_generator(id)
+        if self.transition_duration > 0 and generator is not self.generator and self.sharded is None:
+            # The outgoing mode keeps running until it has faded out
+            self.transition = CrossFade(self.generator, self.playback, self.t, self.it, self.transition_duration, self.x, self.y)
         self.reset()
-        self.generator = self.available_modes[id]["class"]
+        self.generator = generator
+        if self.sharded is not None:
+            self.sharded.set_mode(id, generator.get_parameters())
+        self.update_playback()
 
     def set_color(self, color):
         self.generator.set_random_mode(False)
         self.generator.set_color(color)
+        self.update_parameters()
 
     def set_random_mode(self, random):
         self.generator.set_random_mode(random)
+        self.update_parameters()
 
     def set_speed(self, speed):
         self.generator.set_speed(speed)
+        self.update_parameters()
 
     def set_brightness(self, brightness):
         self.generator.set_brightness(brightness)
+        self.update_parameters()
+
+    def set_gamma(self, gamma):
+        # Gamma correction of the LEDs, applied by a lookup table on output
+        self.sky.set_gamma(gamma)
+        if self.sharded is not None:
+            for panel in self.sharded.panels:
+                panel.sky.set_gamma(gamma)
+
+    def set_output_brightness(self, brightness):
+        # Brightness of the LEDs on top of the brightness of the mode, applied
+        # by the same lookup table as gamma, so it costs nothing per frame
+        self.sky.set_brightness(brightness)
+        if self.sharded is not None:
+            for panel in self.sharded.panels:
+                panel.sky.set_brightness(brightness)
+
+    def set_render_scale(self, scale):
+        # Samples per LED of the current mode, above 1 smooths edges,
+        # below 1 saves render time
+        self.generator.set_render_scale(scale)
+        self.update_parameters()
+
+    def update_parameters(self):
+        if self.sharded is not None:
+            self.sharded.set_parameters(self.generator.get_parameters())
+        self.update_playback()
+
+    def update_playback(self):
+        # Switches to pre-rendered frames when the current mode and parameters are cached
+        self.playback = None
+        if self.frame_cache is None or self.sharded is not None:
+            return
+        self.playback = self.frame_cache.open(self.generator)
+        key = self.frame_cache.get_key(self.generator)
+        if self.playback is None and key is not None:
+            self.cache_requests.put((self.generator, key))
+
+    def is_current(self, generator, key):
+        return self.generator is generator and self.frame_cache.get_key(generator) == key
+
+    def cache_loop(self):
+        while True:
+            generator, key = self.cache_requests.get()
+            # While parameters keep changing, e.g. a slider being dragged,
+            # only the last request is rendered
+            try:
+                while True:
+                    generator, key = self.cache_requests.get(timeout=self.cache_delay)
+            except queue.Empty:
+                pass
+            if not self.is_current(generator, key) or self.playback is not None:
+                continue
+            playback = self.frame_cache.render(generator, self.sky.get_display_colors)
+            # Only switch if nothing changed while rendering
+            if playback is not None and self.is_current(generator, key):
+                self.playback = playback
+
+    def render_frame(self):
+        frame = self.render_mode(self.generator, self.playback, self.t, self.it)
+        transition = self.transition
+        if transition is None:
+            return frame
+        if transition.is_done(self.t):
+            self.transition = None
+            return frame
+        t, it = transition.get_outgoing_time(self.t, self.it)
+        outgoing = self.render_mode(transition.generator, transition.playback, t, it)
+        return transition.blend(self.get_display_colors(outgoing), self.get_display_colors(frame), transition.get_weight(self.t))
+
+    def render_mode(self, generator, playback, t, it):
+        if playback is not None:
+            return playback.get(t)
+        colors = generator.generate_display_colors(t, it)
+        if colors is not None:
+            return colors
+        if self.memo is not None:
+            return self.memo.generate(generator, t, it)
+        return generator.generate(t, it)
+
+    def get_display_colors(self, frame):
+        if isinstance(frame, np.ndarray) and frame.dtype == np.uint8:
+            # Already pre-rendered display colors
+            return frame
+        return self.sky.get_display_colors(frame)
 
     def start(self):
         self.running = True
 
     def stop(self):
         self.running = False
-        self.sky.clear_leds()
+        # Frames still in the pipeline are skipped, wait for the one on the wire
+        self.pipeline.flush()
+        if self.sharded is not None:
+            self.sharded.clear()
+        else:
+            self.sky.clear_leds()
+
+    def close(self):
+        # Turns the LEDs off and releases the outputs, the render workers, the
+        # frame bus and other shared memory, after which main_loop returns
+        self.stop()
+        for generator in {self.generator, *self.generators.values()}:
+            generator.close()
+        if self.sharded is not None:
+            self.sharded.close()
+        self.sky.close()
+        if self.frame_bus is not None:
+            self.frame_bus.close()
+        self.closed = True
+
+    def query(self, reply, name, args):
+        # Calls the query name for another thread and hands reply an
+        # (ok, result or error) tuple. Submitted as a command, so it runs on
+        # the render loop between frames rather than alongside them.
+        try:
+            result = (True, getattr(self, name)(*args))
+        except Exception as e:
+            result = (False, repr(e))
+        reply(result)
+
+    def submit(self, name, *args):
+        # start and stop cancel each other out
+        key = "running" if name in ("start", "stop") else name
+        self.commands.put(name, *args, key=key)
+
+    def get_counters(self):
+        counters = self.scheduler.get_stats()
+        # Frames not sent because the LEDs already showed them
+        counters["skipped_frames"] = self.sky.skipped_frames
+        if self.sharded is not None:
+            counters["skipped_frames"] = sum(panel.sky.skipped_frames for panel in self.sharded.panels)
+        return counters
+
+    def get_frame_stats(self):
+        stats = self.get_counters()
+        stats["stages"] = self.stats.get_summary()
+        return stats
+
+    def get_frame_stats_prometheus(self):
+        return self.stats.to_prometheus(self.get_counters())
 
     def main_loop(self):
-        while (True):
+        self.pipeline.start()
+        while not self.closed:
+            # Resume the animation where it was stopped
+            self.scheduler.reset(self.t)
             while self.running:
-                arr = self.generator.generate(self.t, self.it)
-                self.send_data(arr)
-                time.sleep(self.dt)
-                self.t += self.dt
+                self.commands.apply(self)
+                if not self.running:
+                    # Stopped or closed by a command
+                    break
+                self.t = self.scheduler.time()
+                if self.sharded is not None:
+                    self.sharded.render(self.t, self.it)
+                else:
+                    arr = self.render_frame()
+                    self.pipeline.put(arr)
                 self.it += 1
-            time.sleep(self.dt)
+                self.update_frame_rate()
+                # Below full rate a command starts the next frame right away
+                self.scheduler.wait(self.commands.wait if self.dt > 1 / self.governor.max_fps else None)
+            self.commands.wait(1 / self.governor.idle_fps)
+            self.commands.apply(self)
+
+    def update_frame_rate(self):
+        if self.sharded is not None or self.transition is not None:
+            dt = 1 / self.governor.max_fps
+        else:
+            dt = self.governor.update(self.generator, self.t, self.sky.changed)
+        if dt != self.dt:
+            self.dt = dt
+            self.scheduler.dt = dt
+        # Played back frames do not depend on dt
+        if self.playback is None and self.generator.dt != dt:
+            self.generator.set_dt(dt)
+
+    def output_frame(self, data):
+        # Runs on the output thread of the pipeline
+        if self.running:
+            self.send_data(data)
 
     def send_data(self, data):
-        self.sky.set_lights(data)
+        if self.frame_bus is not None:
+            colors = self.get_display_colors(data)
+            self.frame_bus.publish(colors)
+            self.sky.show_colors(colors)
+        elif isinstance(data, np.ndarray) and data.dtype == np.uint8:
+            # Pre-rendered display colors
+            self.sky.show_colors(data)
+        else:
+            self.sky.set_lights(data)
 
 if __name__ == "__main__":
     con = SkyController()
@@ -0,0 +1,95 @@
+import numpy as np
+from LightSpec import LightSpec
+
+def channel_max(colors):
+    # Largest of the three channels per pixel, faster than
+    # colors.max(axis=-1) on a strided (x, y, 3) view
+    return np.maximum(np.maximum(colors[..., 0], colors[..., 1]), colors[..., 2])
+
+class SkyFrame:
+    # One frame of the sky as a single contiguous (x, y, 4) float32 array.
+    # Channels are r, g, b in 0..255 and the intensity a in 0..1.
+
+    def __init__(self, x, y, data=None) -> None:
+        self.x = x
+        self.y = y
+        if data is None:
+            data = np.zeros((x, y, 4), dtype=np.float32)
+        self.data = data
+
+    @classmethod
+    def from_grid(cls, grid):
+        # Converts the old list of lists of LightSpec objects into a frame
+        frame = cls(len(grid), len(grid[0]))
+        for x in range(frame.x):
+            for y in range(frame.y):
+                item = grid[x][y]
+                frame.data[x, y] = (item.r, item.g, item.b, item.a)
+        return frame
+
+    @classmethod
+    def wrap(cls, data):
+        # Accepts a SkyFrame, a raw (x, y, 4) array or a legacy LightSpec grid
+        if isinstance(data, cls):
+            return data
+        if isinstance(data, np.ndarray):
+            return cls(data.shape[0], data.shape[1], data)
+        return cls.from_grid(data)
+
+    @property
+    def rgb(self):
+        return self.data[..., :3]
+
+    @property
+    def alpha(self):
+        return self.data[..., 3]
+
+    def clear(self):
+        self.data.fill(0)
+        return self
+
+    def copy(self):
+        return SkyFrame(self.x, self.y, self.data.copy())
+
+    def set_color(self, color):
+        self.data[...] = color
+        return self
+
+    def set_color_ci(self, color, intensity):
+        # intensity may be a scalar or an (x, y) array
+        self.data[..., :3] = color
+        self.data[..., 3] = intensity
+        return self
+
+    def to_grid(self):
+        return [[LightSpec(tuple(self.data[x, y])) for y in range(self.y)] for x in range(self.x)]
+
+    # Compatibility with code written against grid[x][y] of LightSpec objects
+    def __len__(self):
+        return self.x
+
+    def __getitem__(self, x):
+        return SkyFrameColumn(self.data[x])
+
+    def __iter__(self):
+        for x in range(self.x):
+            yield self[x]
+
+class SkyFrameColumn:
+
+    def __init__(self, data) -> None:
+        self.data = data
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, y):
+        return LightSpec.view(self.data[y])
+
+    def __iter__(self):
+        for y in range(len(self.data)):
+            yield self[y]
+
+    def __reversed__(self):
+        for y in reversed(range(len(self.data))):
+            yield self[y]
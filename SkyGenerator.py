@@ -1,10 +1,41 @@
 
-from LightSpec import LightSpec
+from SkyFrame import SkyFrame, channel_max
 import math
 import numpy as np
-from perlin_noise import PerlinNoise
 import random
-
+import time
+from ModeRegistry import register
+from ParticleSystem import ParticleSystem
+from NoiseField import NoiseField
+from Resampler import Resampler, linear_weights, sample_window
+from LayerCompositor import Layer, LayerCompositor
+from FrameReceiver import FrameReceiver
+from led_controller import get_index_map
+
+class SkyCoordinates:
+    # Per pixel coordinate fields of one panel geometry, shared read-only
+    # between all generators of that size. For a generator rendering a tile
+    # they cover the tile, in coordinates of the whole canvas. At a render
+    # scale other than 1 there are several or fewer samples per LED, spread
+    # evenly over the whole canvas, so ix and iy become fractional. A tile
+    # then takes the samples of that grid its LEDs are resampled from.
+
+    def __init__(self, generator) -> None:
+        sx, sy, sw, sh = generator.get_render_window()
+        rw, rh = generator.get_canvas_render_shape()
+        self.ix, self.iy = np.indices((sw, sh))
+        self.ix += sx
+        self.iy += sy
+        if (rw, rh) != (generator.x, generator.y):
+            self.ix = (self.ix + 0.5) * generator.x / rw - 0.5
+            self.iy = (self.iy + 0.5) * generator.y / rh - 0.5
+        self.ids = generator.get_id_of_led(self.ix, self.iy)
+        self.x_n, self.y_n = generator.normalize(self.ix, self.iy)
+        self.rho, self.phi = generator.cart2pol(self.x_n, self.y_n)
+        for field in (self.ix, self.iy, self.ids, self.x_n, self.y_n, self.rho, self.phi):
+            field.flags.writeable = False
+
+@register
 class SkyGenerator:
     name = 'default'
     min_speed = 5
@@ -13,6 +44,29 @@ class SkyGenerator:
     color = (0, 0, 255)
     random_mode = False
     brightness = 1
+    # Pure generators render the same image for the same t and parameters.
+    # Stateful ones advance internal state every frame and are never memoized.
+    pure = False
+    # Adaptive generators animate by t or dt rather than by frame count, so
+    # they can be rendered at a lower frame rate, e.g. frame_rate if set
+    adaptive = False
+    frame_rate = None
+    coordinate_cache = {}
+    # FrameStats receiving render and brightness timings, if any
+    stats = None
+    # (x0, y0, w, h) when only part of the x * y canvas is rendered
+    tile = None
+    # Samples per LED along each axis. Only generators that evaluate
+    # continuous coordinates are scalable, the others always render at 1.
+    render_scale = 1
+    scalable = False
+    # Bounds of the render scale, beyond 4 a large canvas would need
+    # gigabytes per frame
+    min_render_scale = 0.1
+    max_render_scale = 4
+    resampler = None
+    # Whether worker processes can each render a tile of this mode
+    shardable = True
 
     def __init__(self, x, y, dt) -> None:
         self.x = x
@@ -31,15 +85,48 @@ class SkyGenerator:
     def set_brightness(self, brightness):
         self.brightness = brightness
 
-    def adjust_grid_for_brightness(self, grid):
-        for x in range(len(grid)):
-            for y in range(len(grid[0])):
-                grid[x][y].a *= self.brightness
-        return grid
+    def adjust_grid_for_brightness(self, frame):
+        frame.data[..., 3] *= self.brightness
+        return frame
 
     def set_random_mode(self, random):
         self.random_mode = random
 
+    def get_parameters(self):
+        return {
+            "color": tuple(int(c) for c in self.color),
+            "speed": self.speed,
+            "brightness": self.brightness,
+            "random_mode": self.random_mode,
+            "render_scale": self.render_scale,
+        }
+
+    def set_parameters(self, parameters):
+        self.set_color(parameters["color"])
+        self.set_speed(parameters["speed"])
+        self.set_brightness(parameters["brightness"])
+        self.set_random_mode(parameters["random_mode"])
+        self.set_render_scale(parameters["render_scale"])
+
+    def is_pure(self):
+        return self.pure
+
+    def is_adaptive(self):
+        # Pure generators only depend on t
+        return self.adaptive or self.is_pure()
+
+    def get_frame_rate(self):
+        # Frame rate that is enough for this generator, None for the highest
+        return self.frame_rate
+
+    def set_dt(self, dt):
+        self.dt = dt
+
+    def get_period(self):
+        # Generators whose image is a pure function of t repeating after a
+        # fixed time return that time, which allows pre-rendering one period
+        return None
+
     def get_random_color(self):
         return tuple(np.random.choice(range(256), size=3))
 
@@ -103,54 +190,139 @@ class SkyGenerator:
         return list(np.random.choice(range(256), size=3))
 
     def length(self, x, y):
-        return math.sqrt(x**2 + y**2)
-
-    def generate(self, t, it):
-        grid = self.get_blank_grid()
-        grid = self.generate_image(t, it, grid)
-        grid = self.adjust_grid_for_brightness(grid)
-        return grid
-
-    def generate_image(self, t, it, grid):
-        for x in range(self.x):
-            for y in range(self.y):
-                if (x + y) % 2 == (it % 2):
-                    grid[x][y].set_color((255, 0, 0, 1))
-                else:
-                    grid[x][y].set_color((0, 255, 0, 1))
-        return grid
+        return np.sqrt(x**2 + y**2)
+
+    def set_tile(self, x0, y0, w, h):
+        self.tile = (x0, y0, w, h)
+
+    def get_tile(self):
+        if self.tile is None:
+            return (0, 0, self.x, self.y)
+        return self.tile
+
+    def get_tile_slice(self):
+        x0, y0, w, h = self.get_tile()
+        return (slice(x0, x0 + w), slice(y0, y0 + h))
+
+    def set_render_scale(self, scale):
+        self.render_scale = min(max(scale, self.min_render_scale), self.max_render_scale)
+
+    def get_render_scale(self):
+        return self.render_scale if self.scalable else 1
+
+    def get_canvas_render_shape(self):
+        # Samples of the render grid over the whole canvas
+        scale = self.get_render_scale()
+        return (max(1, round(self.x * scale)), max(1, round(self.y * scale)))
+
+    def get_render_window(self):
+        # (x0, y0, w, h) of the samples of the canvas render grid the LEDs of
+        # the tile are resampled from, including the samples past its edges
+        # that interpolation mixes in, so tiles match the whole canvas
+        rw, rh = self.get_canvas_render_shape()
+        x0, y0, w, h = self.get_tile()
+        sx, sw = sample_window(rw, self.x, x0, w)
+        sy, sh = sample_window(rh, self.y, y0, h)
+        return (sx, sy, sw, sh)
+
+    def get_render_shape(self):
+        return self.get_render_window()[2:]
+
+    def is_resampled(self):
+        return self.get_canvas_render_shape() != (self.x, self.y)
+
+    def get_resampler(self):
+        # Maps frames of the render window onto the LEDs of the tile
+        key = self.get_canvas_render_shape() + self.get_tile()
+        if self.resampler is None or self.resampler[0] != key:
+            self.resampler = (key, Resampler(*self.get_canvas_render_shape(), self.x, self.y, self.get_tile()))
+        return self.resampler[1]
+
+    def get_coordinates(self):
+        key = (self.x, self.y) + self.get_tile() + self.get_canvas_render_shape()
+        coordinates = SkyGenerator.coordinate_cache.get(key)
+        if coordinates is None:
+            coordinates = SkyCoordinates(self)
+            SkyGenerator.coordinate_cache[key] = coordinates
+        return coordinates
+
+    def generate(self, t, it, frame=None):
+        # Renders into frame if given, e.g. a view into a shared canvas
+        start = time.perf_counter()
+        if frame is None:
+            frame = self.get_blank_frame()
+        else:
+            frame.clear()
+        target = frame
+        if self.is_resampled():
+            frame = SkyFrame(*self.get_render_shape())
+        # Older generators may still return a grid of LightSpec objects
+        result = SkyFrame.wrap(self.generate_image(t, it, frame))
+        if target is not frame:
+            self.get_resampler().resample(result.data, out=target.data)
+        elif result is not frame:
+            frame.data[:] = result.data
+        frame = target
+        rendered = time.perf_counter()
+        frame = self.adjust_grid_for_brightness(frame)
+        if self.stats is not None:
+            self.stats.record("render", rendered - start)
+            self.stats.record("brightness", time.perf_counter() - rendered)
+        return frame
+
+    def generate_image(self, t, it, frame):
+        c = self.get_coordinates()
+        frame.data[:] = (0, 255, 0, 1)
+        frame.data[(c.ix + c.iy) % 2 == (it % 2)] = (255, 0, 0, 1)
+        return frame
+
+    def get_blank_frame(self):
+        _, _, w, h = self.get_tile()
+        return SkyFrame(w, h)
+
+    def close(self):
+        # Releases what the generator holds besides memory, e.g. sockets
+        pass
 
     def get_blank_grid(self):
-        arr = []
-        for x in range(self.x):
-            subarr = []
-            for y in range(self.y):
-                subarr.append(LightSpec((0, 0, 0, 0)))
-            arr.append(subarr)
-        return arr
+        return self.get_blank_frame()
+
+    def generate_display_colors(self, t, it):
+        # Generators that receive final colors rather than rendering them
+        # return them here as (x, y, 3) uint8, shown without the output
+        # stage, which would scale and truncate them again
+        return None
             
+@register
 class MonotoneBlinkGenerator(SkyGenerator):
     name = "Monotone Blinking"
     min_speed = 1
     max_speed = 15
 
-    def generate_image(self, t, it, grid):       
+    def generate_image(self, t, it, frame):       
         # When lights out change color when random mode
         if math.sin(t * self.get_speed()) < -0.99:
             self.set_random_color()
 
-        for x in range(self.x):
-            for y in range(self.y):
-                grid[x][y].set_color_ci(self.color, self.clip_intensity(math.sin(t * self.get_speed()) * 0.5 + 0.5))
-        return grid
+        return frame.set_color_ci(self.color, self.clip_intensity(math.sin(t * self.get_speed()) * 0.5 + 0.5))
 
+    def get_period(self):
+        if self.random_mode:
+            return None
+        return 2 * math.pi / self.get_speed()
+
+    def is_pure(self):
+        # Random mode picks a new color every cycle
+        return not self.random_mode
+
+@register
 class LinearGenerator(SkyGenerator):
     name = "Linear"
     min_speed = 0.1
     max_speed = 2
     leadpoint = 0
 
-    def generate_image(self, t, it, grid):
+    def generate_image(self, t, it, frame):
         # set random color after a whole iteration
         if ((it % (2 * self.x * self.y)) == 0):
             self.set_random_color()
@@ -158,20 +330,17 @@ class LinearGenerator(SkyGenerator):
         self.leadpoint += self.get_speed()
         self.leadpoint %= (2 * self.x * self.y)
     
-        for x in range(self.x):
-            for y in range(self.y):
-                id = self.get_id_of_led(x, y)
-                intensity = 1 if self.leadpoint - id > 0 and self.leadpoint - id < (self.x * self.y) else 0
-                grid[x][y].set_color_ci(self.color, intensity)
-        return grid
+        offset = self.leadpoint - self.get_coordinates().ids
+        return frame.set_color_ci(self.color, (offset > 0) & (offset < (self.x * self.y)))
 
+@register
 class LineGenerator(SkyGenerator):
     name = "Line"
     min_speed = 0.1
     max_speed = 2
     leadpoint = 0
 
-    def generate_image(self, t, it, grid):
+    def generate_image(self, t, it, frame):
         # set random color after a whole iteration
         if (self.leadpoint == 0):
             self.set_random_color()
@@ -179,42 +348,39 @@ class LineGenerator(SkyGenerator):
         self.leadpoint += self.get_speed()
         self.leadpoint %= (self.x * self.y)
 
-        for x in range(self.x):
-            for y in range(self.y):
-                id = self.get_id_of_led(x, y)
-                # A line of 5 pixels is activated
-                intensity = 1 if self.leadpoint - id > 0 and self.leadpoint - id < 5 else 0
-                grid[x][y].set_color_ci(self.color, intensity)
-        return grid
+        # A line of 5 pixels is activated
+        offset = self.leadpoint - self.get_coordinates().ids
+        return frame.set_color_ci(self.color, (offset > 0) & (offset < 5))
 
+@register
 class MultiColorLineGenerator(SkyGenerator):
     name = "Colorful Line"
     min_speed = 0.1
     max_speed = 2
     leadpoint = 0
+    colors = np.array([[255, 0, 0, 1], [255, 165, 0, 1], [255, 255, 0, 1], [0, 255, 0, 1], [0, 0, 255, 1], 
+        [160,32,240, 1], [255, 0, 0, 1], [255, 165, 0, 1], [255, 255, 0, 1], [0, 255, 0, 1], [0, 0, 255, 1], [160,32,240, 1],
+        [255, 0, 0, 1], [255, 165, 0, 1], [255, 255, 0, 1], [0, 255, 0, 1], [0, 0, 255, 1], [160,32,240, 1]], dtype=np.float32)
 
-    def generate_image(self, t, it, grid):
+    def generate_image(self, t, it, frame):
         total = self.x * self.y
-        colors = [[255, 0, 0, 1], [255, 165, 0, 1], [255, 255, 0, 1], [0, 255, 0, 1], [0, 0, 255, 1], 
-        [160,32,240, 1], [255, 0, 0, 1], [255, 165, 0, 1], [255, 255, 0, 1], [0, 255, 0, 1], [0, 0, 255, 1], [160,32,240, 1],
-        [255, 0, 0, 1], [255, 165, 0, 1], [255, 255, 0, 1], [0, 255, 0, 1], [0, 0, 255, 1], [160,32,240, 1]]
         self.leadpoint += self.get_speed()
         self.leadpoint %= total
-        for x in range(self.x):
-            for y in range(self.y):
-                num = x + y * self.x
-                index = int((num + self.leadpoint) % total / math.ceil(total / len(colors)))
-                grid[x][y].set_color(colors[index])
-        return grid
+        index = ((self.get_coordinates().ids + self.leadpoint) % total / math.ceil(total / len(self.colors))).astype(int)
+        frame.data[:] = self.colors[index]
+        return frame
 
+@register
 class CircleGenerator(SkyGenerator):
     name = "Circle"
+    scalable = True
+    adaptive = True
     min_speed = 0.25
     max_speed = 3
     radius = 0.15
     mode = 0
 
-    def generate_image(self, t, it, grid):
+    def generate_image(self, t, it, frame):
         if self.mode == 0:
             self.radius += self.get_speed() *  self.dt
         else:
@@ -226,16 +392,14 @@ class CircleGenerator(SkyGenerator):
             self.mode = 0
             self.set_random_color()
         
-        for x in range(self.x):
-            for y in range(self.y):
-                x_n, y_n = self.normalize(x, y)
-                magnitude = self.length(x_n, y_n)
-                intensity = np.interp(magnitude, [0, 0.85 * self.radius, self.radius], [1, 1, 0])
-                grid[x][y].set_color_ci(self.color,intensity)
-        return grid
+        intensity = np.interp(self.get_coordinates().rho, [0, 0.85 * self.radius, self.radius], [1, 1, 0])
+        return frame.set_color_ci(self.color, intensity)
 
+@register
 class RingGenerator(SkyGenerator):
     name = "Ring"
+    scalable = True
+    adaptive = True
     mode = 0
     min_radius = 0.15
     max_radius = 0.55
@@ -244,7 +408,7 @@ class RingGenerator(SkyGenerator):
     max_speed = 3
     ring_width = 0.4
 
-    def generate_image(self, t, it, grid):
+    def generate_image(self, t, it, frame):
         if self.mode == 0:
             self.radius += self.get_speed() *  self.dt
         else:
@@ -257,107 +421,83 @@ class RingGenerator(SkyGenerator):
             self.mode = 0
             self.set_random_color()
         
-        for x in range(self.x):
-            for y in range(self.y):
-                x_n, y_n = self.normalize(x, y)
-                magnitude = self.length(x_n, y_n)
-                intensity = np.interp(magnitude, [(1 - self.ring_width / 2) * self.radius, self.radius, (1 + self.ring_width / 2) * self.radius], [0, 1, 0])
-                grid[x][y].set_color_ci(self.color,intensity)
-        return grid
+        intensity = np.interp(self.get_coordinates().rho, [(1 - self.ring_width / 2) * self.radius, self.radius, (1 + self.ring_width / 2) * self.radius], [0, 1, 0])
+        return frame.set_color_ci(self.color, intensity)
 
+@register
 class DropGenerator(SkyGenerator):
     name = "Rain"
+    scalable = True
     thickness = 0.2
-    points = []
-    speed = []
-    times = []
-    colors = []
-    next_drop_time = 0
-
-    def generate_image(self, t, it, grid):
-        max_p = self.spike_sin(t * 10) * 0.8
-        if it == self.next_drop_time:
-            self.points.append([random.random() - 0.5, random.random() - 0.5])
-            self.speed.append(3)
-            self.times.append(t)
-            self.next_drop_time += np.random.choice(range(20, 40))
-            if self.random_mode:
-                self.colors.append(self.get_random_color())
-            else:
-                self.colors.append(self.color)
-        for x in range(self.x):
-            subarr = []
-            for y in range(self.y):
-                x_n, y_n = self.normalize(x, y)
-                intensity = 0
-                delete_list = []
-                for i in range(len(self.points)):
-                    magnitude_to_point = self.length(x_n - self.points[i][0], y_n - self.points[i][1])
-                    radius = (t - self.times[i]) * self.speed[i]
-                    if radius > 2:
-                        delete_list.append(i)
-                    intensity = np.interp(magnitude_to_point, [radius - self.thickness / 2, radius, radius + self.thickness / 2], [0, 1, 0])
-                    grid[x][y].set_color_ci(self.colors[i], intensity)
-                for i in range(len(delete_list)):
-                    del self.points[i]
-                    del self.speed[i]
-                    del self.times[i]
-        return grid
+    drop_speed = 3
+    # A drop is gone once its ring has grown to this radius
+    max_radius = 2
+    max_drops = 64
 
+    def __init__(self, x, y, dt) -> None:
+        super().__init__(x, y, dt)
+        self.drops = ParticleSystem(self.max_drops)
+        self.next_drop_time = 0
+
+    def generate_image(self, t, it, frame):
+        if it == 0:
+            # Animation restarted
+            self.drops.clear()
+            self.next_drop_time = 0
+        if it >= self.next_drop_time:
+            color = self.get_random_color() if self.random_mode else self.color
+            self.drops.spawn((random.random() - 0.5, random.random() - 0.5), t, self.drop_speed, color, self.max_radius / self.drop_speed)
+            self.next_drop_time = it + np.random.choice(range(20, 40))
+        alive, rings = self.drops.get_ring_intensities(self.get_coordinates(), t, self.thickness)
+        if len(alive) == 0:
+            return frame
+        # Every pixel shows the drop whose ring is brightest there
+        strongest = rings.argmax(axis=0)
+        frame.rgb[:] = self.drops.colors[alive][strongest]
+        frame.alpha[:] = rings.max(axis=0)
+        return frame
+
+@register
 class ColorPulseGenerator(SkyGenerator):
     name = "Colorful pulse"
+    scalable = True
     thickness = 0.2
-    points = []
-    speed = []
-    times = []
-    next_drop_time = 0
+    pulse_speed = 3
+    max_radius = 2
+    max_pulses = 64
     colors = [[255, 0, 0], [0, 0, 255], [0, 255, 0]]
-    colorindex = []
-
-    def generate_image(self, t, it, grid):
-        arr = []
-        max_p = self.spike_sin(t * 10) * 0.8
-        if it == self.next_drop_time:
-            self.points.append([0,0])
-            self.speed.append(3)
-            self.times.append(t)
-            self.next_drop_time += 5
-            self.colorindex.append(np.random.choice(range(0,len(self.colors)), size=1)[0])
-        for x in range(self.x):
-            subarr = []
-            for y in range(self.y):
-                x_n, y_n = self.normalize(x, y)
-                intensity = 0
-                delete_list = []
-                color = [0,0,0]
-                for i in range(len(self.points)):
-                    magnitude_to_point = self.length(x_n - self.points[i][0], y_n - self.points[i][1])
-                    radius = (t - self.times[i]) * self.speed[i]
-                    if radius > 2:
-                        delete_list.append(i)
-                    intensity += np.interp(magnitude_to_point, [radius - self.thickness / 2, radius, radius + self.thickness / 2], [0, 1, 0])
-                    color += self.colors[self.colorindex[0]]
-                    # TODO: FIX
-                intensity = min(1, intensity)
-                color.append(intensity)
-                subarr.append(LightSpec(color))
-                for i in range(len(delete_list)):
-                    del self.points[i]
-                    del self.speed[i]
-                    del self.times[i]
-                    del self.colorindex[i]
-            arr.append(subarr)
-        return arr
 
+    def __init__(self, x, y, dt) -> None:
+        super().__init__(x, y, dt)
+        self.pulses = ParticleSystem(self.max_pulses)
+        self.next_drop_time = 0
+
+    def generate_image(self, t, it, frame):
+        if it == 0:
+            self.pulses.clear()
+            self.next_drop_time = 0
+        if it >= self.next_drop_time:
+            color = self.colors[np.random.choice(range(0,len(self.colors)))]
+            self.pulses.spawn((0, 0), t, self.pulse_speed, color, self.max_radius / self.pulse_speed)
+            self.next_drop_time = it + 5
+        alive, rings = self.pulses.get_ring_intensities(self.get_coordinates(), t, self.thickness)
+        # Overlapping pulses mix their colors by intensity
+        frame.rgb[:] = np.einsum("kxy,kc->xyc", rings, self.pulses.colors[alive])
+        frame.alpha[:] = np.minimum(1, rings.sum(axis=0))
+        return frame
+
+@register
 class SquareGenerator(SkyGenerator):
     name = "Square"
+    scalable = True
+    adaptive = True
     min_radius = 0
     max_radius = 0.6
     radius = 0
     min_speed = 0.2
     max_speed = 1.5
 
-    def generate_image(self, t, it, grid):
+    def generate_image(self, t, it, frame):
 
         self.radius += self.get_speed() *  self.dt
 
@@ -365,280 +505,229 @@ class SquareGenerator(SkyGenerator):
             self.radius = self.min_radius
             self.set_random_color()
 
-        for x in range(self.x):
-            for y in range(self.y):
-                x_n, y_n = self.normalize(x, y)
-                intensity = 1 if max(abs(x_n), abs(y_n)) < self.radius else 0
-                grid[x][y].set_color_ci(self.color, intensity)
-        return grid
+        c = self.get_coordinates()
+        return frame.set_color_ci(self.color, np.maximum(np.abs(c.x_n), np.abs(c.y_n)) < self.radius)
 
+@register
 class BandGenerator(SkyGenerator):
-    def get_name(self):
-        return "Band"
-    def generate_image(self, t, it):
-        arr = []
-        num_it = it % (self.x * self.y) 
-        total = self.x * self.y
-        for x in range(self.x):
-            subarr = []
-            for y in range(self.y):
-                x_n, y_n = self.normalize(x, y)
-                intensity = 0 if self.length(x_n, y_n) < (t * 4) % 1 and self.length(x_n, y_n) > (t * 4 - 0.2) % 1 else 1
-                intensity = math.cos(self.length(x_n, y_n) * t * 10)
-                color = list(np.random.choice(range(256), size=3))
-                color = [255, 255, 0]
-                color.append(intensity)
-                subarr.append(LightSpec(color))
-            arr.append(subarr)
-        return arr
+    name = "Band"
+    scalable = True
+    pure = True
 
-class CircularGenerator(SkyGenerator):
-    def get_name(self):
-        return "Circular"
-    def generate_image(self, t, it):
-        arr = []
-        for x in range(self.x):
-            subarr = []
-            for y in range(self.y):
-                x_n, y_n = self.normalize(x, y)
-                rho, phi = self.cart2pol(x_n, y_n)
-                intensity = 1 if phi < ((t * 10) % (2 * math.pi) - math.pi) else 0
-                print((t * 10) % (2 * math.pi) - math.pi)
-                if int(((t * 10) / (2 * math.pi)) - math.pi) % 2 == 1:
-                    intensity = 1 - intensity
-                subarr.append(LightSpec((255, 255, 0, intensity)))
-
-            arr.append(subarr)
-        return arr
+    def generate_image(self, t, it, frame):
+        return frame.set_color_ci([255, 255, 0], np.cos(self.get_coordinates().rho * t * 10))
 
+@register
+class CircularGenerator(SkyGenerator):
+    name = "Circular"
+    scalable = True
+    pure = True
+
+    def generate_image(self, t, it, frame):
+        intensity = self.get_coordinates().phi < ((t * 10) % (2 * math.pi) - math.pi)
+        # Every second sweep is inverted. floor rather than int, which rounds
+        # towards zero and made the first sweeps differ from the later ones.
+        if math.floor(((t * 10) / (2 * math.pi)) - math.pi) % 2 == 1:
+            intensity = ~intensity
+        return frame.set_color_ci((255, 255, 0), intensity)
+
+    def get_period(self):
+        # Two sweeps
+        return 4 * math.pi / 10
+
+@register
 class WaveGenerator(SkyGenerator):
-    def get_name(self):
-        return "Waves"
-    def generate_image(self, t, it):
-        arr = []
-        num_it = it % (self.x * self.y) 
-        total = self.x * self.y
-        for x in range(self.x):
-            subarr = []
-            for y in range(self.y):
-                x_n, y_n = self.normalize(x, y)
-                intensity = math.sin(t * x ) * 0.5 + 0.5
-                subarr.append(LightSpec((255, 255, 0, intensity)))
-            arr.append(subarr)
-        return arr
+    name = "Waves"
+    scalable = True
+    pure = True
+
+    def generate_image(self, t, it, frame):
+        return frame.set_color_ci((255, 255, 0), np.sin(t * self.get_coordinates().ix) * 0.5 + 0.5)
+
+    def get_period(self):
+        # Only repeats while every sample sits on a whole LED position
+        if self.get_render_scale() != 1:
+            return None
+        return 2 * math.pi
 
+@register
 class PerlinGenerator(SkyGenerator):
-    def get_name(self):
-        return "Sponsored by Perlin"
+    name = "Sponsored by Perlin"
+    scalable = True
+    pure = True
+
     def __init__(self, x, y, dt) -> None:
         self.x = x
         self.y = y
-        self.noise = PerlinNoise(octaves=3.5)
+        self.noise = NoiseField(frequency=3.5)
         self.dt = dt
 
-    def generate_image(self, t, it):
-        arr = []       
-        for x in range(self.x):
-            subarr = []
-            for y in range(self.y):
-                x_n, y_n = self.normalize(x, y)
-                intensity = self.clip_intensity(self.noise([(x * t * 0.1),(y * t * 0.1)]))
-                subarr.append(LightSpec((255, 255, 0, intensity)))
-            arr.append(subarr)
-        return arr
+    def generate_image(self, t, it, frame):
+        c = self.get_coordinates()
+        intensity = self.noise.noise2(c.ix * t * 0.1, c.iy * t * 0.1)
+        return frame.set_color_ci((255, 255, 0), np.clip(intensity, 0, 1))
 
+@register
 class StarGenerator(SkyGenerator):
-    def get_name(self):
-        return "Starry sky"
+    name = "Starry sky"
+    pure = True
+    # Thin clouds drifting over the stars, baked once as a looping noise volume.
+    # The haze is smooth, so it is baked on a coarse grid and interpolated up.
+    haze_frames = 16
+    haze_duration = 20
+    haze_resolution = 24
+    # The shimmer is slow
+    frame_rate = 20
+
     def __init__(self, x, y, dt) -> None:
         self.x = x
         self.y = y
         self.dt = dt
-        self.noise = PerlinNoise(octaves=3.5)
         self.noise = np.random.normal(0.5, 0.2, size=(x, y))
+        self.frequency = np.maximum(self.noise, 0.01) * 7
+        hx = min(x, self.haze_resolution)
+        hy = min(y, self.haze_resolution)
+        x_n, y_n = self.normalize(*np.meshgrid(np.linspace(0, x - 1, hx), np.linspace(0, y - 1, hy), indexing="ij"))
+        # frequency * haze_duration is whole, so the haze loops seamlessly
+        self.haze = NoiseField(frequency=1.5, octaves=2).bake(x_n, y_n, self.haze_frames, self.haze_duration)
+        self.haze_x = linear_weights(hx, x)
+        self.haze_y = linear_weights(hy, y)
+
+    def generate_image(self, t, it, frame):
+        tx, ty = self.get_tile_slice()
+        haze = self.haze_x[tx] @ self.haze.sample(t) @ self.haze_y[ty].T
+        intensity = np.sin(self.frequency[tx, ty] * t) * 0.5 + 0.5
+        intensity *= np.clip(0.75 + 0.5 * haze, 0.25, 1)
+        return frame.set_color_ci((255, 255, 0), np.clip(intensity, 0, 1))
+
+@register
+class HeartGenerator(SkyGenerator):
+    name = "ILuvYu"
+    scalable = True
+    pure = True
 
-    def generate_image(self, t, it):
-        arr = []       
-        for x in range(self.x):
-            subarr = []
-            for y in range(self.y):
-                x_n, y_n = self.normalize(x, y)
-                intensity = math.sin(max(self.noise[x,y], 0.01) * 7 * t) * 0.5 + 0.5
-                subarr.append(LightSpec((255, 255, 0, self.clip_intensity(intensity))))
-            arr.append(subarr)
-        return arr
+    def generate_image(self, t, it, frame):
+        c = self.get_coordinates()
+        x_n = c.x_n
+        y_n = 0.1 - c.y_n
+        dist = (x_n ** 2 + y_n ** 2 - 0.05 * (math.sin(t * 10) + 1)) ** 3 - x_n ** 2 * y_n ** 3
+        return frame.set_color_ci([255, 0, 0], dist < 0)
 
-class HeartGenerator(SkyGenerator):
-    def get_name(self):
-        return "ILuvYu"
-    def generate_image(self, t, it):
-        arr = []
-        for x in range(self.x):
-            subarr = []
-            for y in range(self.y):
-                x_n, y_n = self.normalize(x, y)
-                y_n *= -1 
-                y_n += 0.1
-                intensity = 1 if (x_n ** 2 + y_n ** 2 - 0.05 * (math.sin(t * 10) + 1)) ** 3 < x_n ** 2 * y_n ** 3 else 0
-                dist = (x_n ** 2 + y_n ** 2 - 0.05 * (math.sin(t * 10) + 1)) ** 3 - x_n ** 2 * y_n ** 3
-                intensity = 1 if dist < 0 else 0             
-                if dist < 0.001 and dist > 0:
-                    pass
-                    #intensity = np.interp(dist, [0, 0.001], [1, 0])
-                color = [255, 0, 0]
-                color.append(intensity)
-                subarr.append(LightSpec(color))
-            arr.append(subarr)
-        return arr
+    def get_period(self):
+        return 2 * math.pi / 10
 
+@register
 class MetronomeGenerator(SkyGenerator):
-    def get_name(self):
-        return "Metronome"
-    def generate_image(self, t, it):
-        arr = []
-        for x in range(self.x):
-            subarr = []
-            for y in range(self.y):
-                x_n, y_n = self.normalize(x, y)
-                rho, phi = self.cart2pol(x_n, y_n)
-                intensity = 1 
-                if phi < math.sin(t * 10) * math.pi:
-                    color = [255, 0, 0]
-                else:
-                    color = [0, 255, 0]
-                color.append(intensity)
-                subarr.append(LightSpec(color))
-
-            arr.append(subarr)
-        return arr
+    name = "Metronome"
+    scalable = True
+    pure = True
 
-class DiskGenerator(SkyGenerator):
-    def get_name(self):
-        return "Spinning"
-    def generate_image(self, t, it):
-        arr = []
-        for x in range(self.x):
-            subarr = []
-            for y in range(self.y):
-                x_n, y_n = self.normalize(x, y)
-                rho, phi = self.cart2pol(x_n, y_n)
-                intensity = 1 
-                phi_n = (phi + math.pi) / (2 * math.pi)
-                t_p = t * 10
-                t_n = math.sin(t_p) * 0.5 + 0.5
-                t_n = (t * 4) % 1 
-                diff = abs(phi_n - t_n)
-                if diff < 0.75 and diff > 0.25: 
-                    color = [255, 0, 0]
-                else:
-                    color = [0, 255, 0]
-                color.append(intensity)
-                subarr.append(LightSpec(color))
-
-            arr.append(subarr)
-        return arr
+    def generate_image(self, t, it, frame):
+        frame.set_color_ci([0, 255, 0], 1)
+        frame.rgb[self.get_coordinates().phi < math.sin(t * 10) * math.pi] = [255, 0, 0]
+        return frame
 
-class LightHouseGenerator(SkyGenerator):
-    def get_name(self):
-        return "Lighthouse"
-    def generate_image(self, t, it):
-        arr = []
-        for x in range(self.x):
-            subarr = []
-            for y in range(self.y):
-                x_n, y_n = self.normalize(x, y)
-                rho, phi = self.cart2pol(x_n, y_n)
-                phi_n = (phi + math.pi) / (2 * math.pi)
-                t_n = (t * 2) % 1 
-                diff = abs(phi_n - t_n)
-                if diff <= 0.66 and diff > 0.33:
-                    color = [255, 255, 0]
-                else: 
-                    color = [0, 0, 0]
-                co = 0.05
-                intensity = np.interp(diff, [0.36 - co, 0.36, 0.63, 0.63 + co], [0, 1, 1, 0])
-                color = [255, 255, 0]
-                color.append(intensity)
-                subarr.append(LightSpec(color))
-
-            arr.append(subarr)
-        return arr
+    def get_period(self):
+        return 2 * math.pi / 10
 
+@register
+class DiskGenerator(SkyGenerator):
+    name = "Spinning"
+    scalable = True
+    pure = True
+
+    def generate_image(self, t, it, frame):
+        t_n = (t * 4) % 1 
+        phi_n = (self.get_coordinates().phi + math.pi) / (2 * math.pi)
+        diff = np.abs(phi_n - t_n)
+        frame.set_color_ci([0, 255, 0], 1)
+        frame.rgb[(diff < 0.75) & (diff > 0.25)] = [255, 0, 0]
+        return frame
+
+    def get_period(self):
+        return 1 / 4
+
+@register
+class LightHouseGenerator(SkyGenerator):
+    name = "Lighthouse"
+    scalable = True
+    pure = True
+
+    def generate_image(self, t, it, frame):
+        t_n = (t * 2) % 1 
+        co = 0.05
+        phi_n = (self.get_coordinates().phi + math.pi) / (2 * math.pi)
+        diff = np.abs(phi_n - t_n)
+        intensity = np.interp(diff, [0.36 - co, 0.36, 0.63, 0.63 + co], [0, 1, 1, 0])
+        return frame.set_color_ci([255, 255, 0], intensity)
+
+    def get_period(self):
+        return 1 / 2
+
+@register
 class AngleLineGenerator(SkyGenerator):
     name = "Angled Lines"
+    scalable = True
+    adaptive = True
     angle = 0
     last_t_n = 0
     length = 1.5
     co = 0.15
 
-    def generate_image(self, t, it):
-        arr = []
+    def generate_image(self, t, it, frame):
         t_n = (t * 3) % self.length - self.length / 2
         if (self.last_t_n - t_n) > 0.5:
             self.angle = random.random() * 2 * math.pi
         self.last_t_n = t_n
         
-        for x in range(self.x):
-            subarr = []
-            for y in range(self.y):
-                x_n, y_n = self.normalize(x, y)
-                _, y_c = self.rotate_point(x_n, y_n, self.angle)             
-                intensity = np.interp(y_c, [t_n - self.co, t_n, t_n + self.co], [0, 1, 0])
-                color = [255, 255, 0]
-                color.append(intensity)
-                subarr.append(LightSpec(color))
-
-            arr.append(subarr)
-        return arr
+        c = self.get_coordinates()
+        _, y_c = self.rotate_point(c.x_n, c.y_n, self.angle)             
+        intensity = np.interp(y_c, [t_n - self.co, t_n, t_n + self.co], [0, 1, 0])
+        return frame.set_color_ci([255, 255, 0], intensity)
 
+@register
 class SpiralGenerator(SkyGenerator):
-    def get_name(self):
-        return "Spiral"
+    name = "Spiral"
+    scalable = True
+
     def __init__(self, x, y, dt) -> None:
         self.x = x
         self.y = y
+        self.dt = dt
         self.radius = 0.15 
         self.angle = 0
         self.distance = 0
         self.speed_a = 0.5
         self.speed_d = 0.007  
-        self.arr = []
+        self.arr = None
         self.reset_arr()
         self.last_dist = 0
 
     def reset_arr(self):
-        self.arr = []   
-        for x in range(self.x):
-            subarr = []
-            for y in range(self.y):                
-                subarr.append(0)
-            self.arr.append(subarr)
-
-    def generate_image(self, t, it):
-        arr = []
+        self.arr = np.zeros(self.get_render_shape(), dtype=np.float32)
+
+    def generate_image(self, t, it, frame):
         self.distance = (self.distance + self.speed_d) % 0.7
         self.angle = (self.angle + self.speed_a) % (2 * math.pi)
         x_p, y_p = self.pol2cart(self.distance, self.angle)
-        for x in range(self.x):
-            subarr = []
-            for y in range(self.y):
-                x_n, y_n = self.normalize(x, y)
-                
-                intensity = 0
-                magnitude_to_point = self.length(x_n - x_p, y_n - y_p)
-                
-                self.arr[x][y] += np.interp(magnitude_to_point, [0, self.radius * 0.99, self.radius], [1, 1, 0])
-                intensity = min(1, self.arr[x][y])
-                subarr.append(LightSpec((255, 255, 0, intensity)))
-            arr.append(subarr)
+        c = self.get_coordinates()
+        if self.arr.shape != c.x_n.shape:
+            # Tile or render scale changed
+            self.reset_arr()
+        magnitude_to_point = self.length(c.x_n - x_p, c.y_n - y_p)
+        self.arr += np.interp(magnitude_to_point, [0, self.radius * 0.99, self.radius], [1, 1, 0])
+        frame.set_color_ci((255, 255, 0), np.minimum(1, self.arr))
         if abs(self.last_dist - self.distance) > 0.5:
             self.reset_arr()
         self.last_dist = self.distance
-        return arr
+        return frame
 
+@register
 class DVDGenerator(SkyGenerator):
-    def get_name(self):
-        return "DVD"
+    name = "DVD"
+    scalable = True
+    adaptive = True
+
     def __init__(self, x, y, dt) -> None:
         self.x = x
         self.y = y
@@ -662,8 +751,7 @@ class DVDGenerator(SkyGenerator):
         l = self.length(x[0], x[1])
         return [x[0] / l, x[1] / l]
 
-    def generate_image(self, t, it):
-        arr = []
+    def generate_image(self, t, it, frame):
         self.pos[0] += self.speed * self.dt * self.direction[0]
         self.pos[1] += self.speed * self.dt * self.direction[1]
         if self.pos[0] > 0.5: 
@@ -676,15 +764,120 @@ class DVDGenerator(SkyGenerator):
             self.direction = self.reflect(self.direction, [0, 1])
             self.pos[1] = -0.49
 
-        for x in range(self.x):
-            subarr = []
-            for y in range(self.y):
-                x_n, y_n = self.normalize(x, y)
-                dist = self.length(self.pos[0] - x_n, self.pos[1] - y_n)          
-                intensity = np.interp(dist, [0, self.radius * 0.95, self.radius], [1, 1, 0])
-                color = [255, 255, 0]
-                color.append(intensity)
-                subarr.append(LightSpec(color))
-
-            arr.append(subarr)
-        return arr
\ No newline at end of file
+        c = self.get_coordinates()
+        dist = self.length(self.pos[0] - c.x_n, self.pos[1] - c.y_n)          
+        intensity = np.interp(dist, [0, self.radius * 0.95, self.radius], [1, 1, 0])
+        return frame.set_color_ci([255, 255, 0], intensity)
+
+@register
+class NetworkGenerator(SkyGenerator):
+    name = "Network"
+    # Shows frames rendered by another process or machine and sent as DDP
+    # packets of width * height rgb pixels in strip order, the order the ddp
+    # output sends them in, so one SkyLight can drive another.
+    # address is a (host, port) to listen on for UDP or a Unix socket path.
+    address = ("0.0.0.0", 4048)
+    receiver = None
+    # Every worker would listen on the same address
+    shardable = False
+
+    def receive(self):
+        # The latest received frame as (x, y, 3) rgb colors
+        if self.receiver is None:
+            # Listening starts when the mode is first shown
+            self.receiver = FrameReceiver(self.x * self.y * 3, self.address)
+            self.received = np.zeros((self.x * self.y, 3), dtype=np.uint8)
+            self.index_map = get_index_map(self.x, self.y)
+        self.receiver.read(self.received)
+        # A new array every frame, the previous one may still be on its way out
+        colors = np.empty_like(self.received)
+        colors[self.index_map] = self.received
+        return colors.reshape(self.x, self.y, 3)
+
+    def generate_display_colors(self, t, it):
+        colors = self.receive()
+        if self.brightness != 1:
+            colors = (colors * self.brightness).astype(np.uint8)
+        return colors
+
+    def generate_image(self, t, it, frame):
+        # Only used where frames are needed, e.g. the benchmark. The output
+        # stage scales colors to full intensity, so the peak goes into alpha.
+        rgb = self.receive()[self.get_tile_slice()]
+        frame.rgb[:] = rgb
+        frame.alpha[:] = channel_max(rgb) / 255
+        return frame
+
+    def close(self):
+        # Shown again, the mode listens again
+        if self.receiver is not None:
+            self.receiver.close()
+            self.receiver = None
+
+class LayeredGenerator(SkyGenerator):
+    # Runs several generators as layers, bottom first, and composites them.
+    # Subclasses list their layers as (generator class, blend, opacity, fps)
+    # in presets; fps None renders the layer every frame.
+    presets = []
+
+    def __init__(self, x, y, dt, layers=None) -> None:
+        super().__init__(x, y, dt)
+        if layers is None:
+            # Layers stepping at their own rate advance by their own dt
+            layers = [Layer(cls(x, y, 1 / fps if fps else dt), blend, opacity, fps) for cls, blend, opacity, fps in self.presets]
+        self.layers = layers
+        self.compositor = LayerCompositor()
+
+    def generate_image(self, t, it, frame):
+        return self.compositor.composite(self.layers, t, it, frame)
+
+    # Parameters apply to every layer, except brightness which applies to the result
+
+    def set_speed(self, speed):
+        super().set_speed(speed)
+        for layer in self.layers:
+            layer.generator.set_speed(speed)
+
+    def set_color(self, color):
+        super().set_color(color)
+        for layer in self.layers:
+            layer.generator.set_color(color)
+
+    def set_random_mode(self, random):
+        super().set_random_mode(random)
+        for layer in self.layers:
+            layer.generator.set_random_mode(random)
+
+    def set_render_scale(self, scale):
+        super().set_render_scale(scale)
+        for layer in self.layers:
+            layer.generator.set_render_scale(scale)
+
+    def set_tile(self, x0, y0, w, h):
+        super().set_tile(x0, y0, w, h)
+        for layer in self.layers:
+            layer.generator.set_tile(x0, y0, w, h)
+
+    def set_dt(self, dt):
+        super().set_dt(dt)
+        # Layers with their own rate keep their own dt
+        for layer in self.layers:
+            if layer.fps is None:
+                layer.generator.set_dt(dt)
+
+    def close(self):
+        for layer in self.layers:
+            layer.generator.close()
+
+    def is_adaptive(self):
+        return all(layer.generator.is_adaptive() for layer in self.layers)
+
+    def get_frame_rate(self):
+        rates = [layer.generator.get_frame_rate() for layer in self.layers]
+        return None if None in rates else max(rates)
+
+@register
+class StarryDVDGenerator(LayeredGenerator):
+    name = "DVD under the stars"
+    # The slowly shimmering sky does not need more than 10 fps
+    presets = [(StarGenerator, "over", 1, 10), (DVDGenerator, "over", 1, None)]
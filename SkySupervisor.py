@@ -0,0 +1,189 @@
+import atexit
+import functools
+import multiprocessing as mp
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Controller methods the API may call and wait for
+queries = {"get_available_modes", "get_frame_stats", "get_frame_stats_prometheus"}
+
+def isolate(cpu, priority):
+    # Pins the render process to one core and optionally gives it a real-time
+    # priority, which needs root, e.g. running under sudo
+    if cpu is not None and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {cpu})
+    if priority is not None and hasattr(os, "sched_setscheduler"):
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+        except OSError as e:
+            print("Render process keeps normal priority:", e)
+
+def run_controller(connection, options, cpu, priority):
+    # Entry point of the render process
+    from SkyController import SkyController
+    isolate(cpu, priority)
+    controller = SkyController(**options)
+    threading.Thread(target=serve_commands, args=(controller, connection), daemon=True).start()
+    controller.main_loop()
+
+def serve_commands(controller, connection):
+    # Only hands commands and queries to the render loop, which runs them
+    # between frames, so API traffic never runs alongside a frame
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            # The API process is gone. The render loop turns the LEDs off,
+            # releases shared memory and returns, which ends the process.
+            controller.submit("close")
+            return
+        if message[0] == "submit":
+            _, name, args = message
+            controller.submit(name, *args)
+        else:
+            _, number, name, args = message
+            controller.submit("query", functools.partial(send_answer, connection, number), name, args)
+
+def send_answer(connection, number, result):
+    # Answers carry the number of their call, so the answer to a call that
+    # timed out is not taken for the answer to the next one
+    connection.send((number, result))
+
+class SkySupervisor:
+    # Runs SkyController with its render loop and output in a separate
+    # process, so API requests never compete with frames for the GIL.
+    # Commands go over a pipe as small (kind, name, args) tuples, calls also
+    # carry a number. A render process that dies is started again with the
+    # last settings replayed, except a command sent just before it died,
+    # which may be what killed it. Restarts of a process that keeps dying
+    # right away back off up to max_restart_delay seconds.
+    crash_window = 5
+    min_restart_delay = 1
+    max_restart_delay = 60
+
+    def __init__(self, cpu=None, priority=None, timeout=5, **options) -> None:
+        self.cpu = cpu
+        self.priority = priority
+        # Seconds a query may take before it fails
+        self.timeout = timeout
+        self.options = options
+        self.context = mp.get_context("spawn")
+        # Sending on and replacing the pipe
+        self.lock = threading.Lock()
+        # One call at a time waits for its answer, commands do not wait for it
+        self.call_lock = threading.Lock()
+        self.calls = 0
+        # The last command per key, replayed after a restart
+        self.settings = OrderedDict()
+        # Key and time of the last command
+        self.last_command = None
+        self.process = None
+        self.connection = None
+        self.started = None
+        self.closing = False
+
+    def start(self):
+        self.start_process()
+        threading.Thread(target=self.watch, daemon=True).start()
+        atexit.register(self.close)
+
+    def start_process(self):
+        self.connection, child = self.context.Pipe()
+        self.process = self.context.Process(target=run_controller, args=(child, self.options, self.cpu, self.priority))
+        self.process.start()
+        self.started = time.monotonic()
+        child.close()
+
+    def watch(self):
+        delay = self.min_restart_delay
+        while True:
+            process = self.process
+            process.join()
+            if self.closing:
+                return
+            if time.monotonic() - self.started > self.max_restart_delay:
+                # It ran fine for a while
+                delay = self.min_restart_delay
+            print("Render process exited with code {}, restarting in {}s".format(process.exitcode, delay))
+            with self.lock:
+                self.drop_last_command()
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_restart_delay)
+            with self.lock:
+                if self.closing:
+                    return
+                self.start_process()
+                for name, args in self.settings.values():
+                    self.connection.send(("submit", name, args))
+
+    def drop_last_command(self):
+        if self.last_command is None:
+            return
+        key, sent = self.last_command
+        self.last_command = None
+        if time.monotonic() - sent < self.crash_window and key in self.settings:
+            print("Not replaying {}, sent just before the render process exited".format(self.settings[key][0]))
+            del self.settings[key]
+
+    def submit(self, name, *args):
+        # Same keys as SkyController.submit
+        key = "running" if name in ("start", "stop") else name
+        with self.lock:
+            self.settings[key] = (name, args)
+            self.settings.move_to_end(key)
+            self.last_command = (key, time.monotonic())
+            try:
+                self.connection.send(("submit", name, args))
+            except OSError:
+                # The render process is down, the restart replays the command
+                pass
+
+    def call(self, name, *args):
+        if name not in queries:
+            raise ValueError("Not a controller query: {}".format(name))
+        with self.call_lock:
+            with self.lock:
+                self.calls += 1
+                number = self.calls
+                connection = self.connection
+                try:
+                    connection.send(("call", number, name, args))
+                except OSError:
+                    raise RuntimeError("Render process is restarting")
+            deadline = time.monotonic() + self.timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not connection.poll(remaining):
+                    raise TimeoutError("Render process did not answer {} within {}s".format(name, self.timeout))
+                try:
+                    answer, (ok, result) = connection.recv()
+                except EOFError:
+                    raise RuntimeError("Render process exited")
+                # Skips late answers to calls that timed out
+                if answer == number:
+                    break
+        if not ok:
+            raise RuntimeError("Render process failed: " + result)
+        return result
+
+    def get_available_modes(self):
+        return self.call("get_available_modes")
+
+    def get_frame_stats(self):
+        return self.call("get_frame_stats")
+
+    def get_frame_stats_prometheus(self):
+        return self.call("get_frame_stats_prometheus")
+
+    def close(self):
+        if self.closing:
+            return
+        self.closing = True
+        # Closing the pipe makes the render process clear the LEDs and exit
+        with self.lock:
+            self.connection.close()
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.terminate()
@@ -1,60 +1,159 @@
-import board
-import neopixel
-from time import sleep
-from LightSpec import LightSpec
+from time import sleep, perf_counter
+from SkyFrame import SkyFrame, channel_max
+from OutputBackends import OutputBackend, create_backend
+import numpy as np
+
+def get_index_map(w, h):
+    # Position i on the strip shows pixel index_map[i] of the flattened (w, h) frame.
+    # Every second column is wired in the opposite direction.
+    index_map = np.arange(w * h).reshape(w, h)
+    index_map[1::2] = index_map[1::2, ::-1]
+    return index_map.ravel()
 
 class LEDController:
 
-    def __init__(self, w, h):
+    # The strip takes (g, r, b) tuples
+    channel_order = [1, 0, 2]
+    # Above this many changed ranges a frame is written whole
+    max_ranges = 32
+
+    def __init__(self, w, h, output="neopixel", gamma=1, brightness=1, **options):
+        # output is a backend name from OutputBackends or an OutputBackend
         self.w = w
         self.h = h
-        self.pixels = neopixel.NeoPixel(board.D18, w * h, brightness = 1, auto_write=False)
-
-    def maximise_color(self, color):
-        max_value = max(color)
-        if max_value == 0:
-            return (0,0,0)
-        factor = 255 / max_value
-        return tuple(int(factor * x) for x in color)
-
-    def format_color(self, color):
-        color_f = (color.g, color.r, color.b)
-        color_f = self.maximise_color(color_f)
-        return tuple(int(color.a * x) for x in color_f)
-
-    def set_lights(self, leds):
-        led_format = []
-        for i in range(len(leds)):
-            if i % 2 == 0:
-                led_format.append(leds[i])
+        if isinstance(output, OutputBackend):
+            self.output = output
+        else:
+            self.output = create_backend(output, w * h, **options)
+        self.index_map = self.get_index_map()
+        self.strip_index = self.get_strip_index()
+        # Gamma and output brightness are applied through a lookup table
+        # on the final bytes, rebuilt only when either changes
+        self.gamma = gamma
+        self.brightness = brightness
+        self.lut = self.get_lut()
+        # FrameStats receiving format and show timings, if any
+        self.stats = None
+        # The colors on the LEDs, to skip frames that would not change them
+        self.last_colors = None
+        self.skipped_frames = 0
+        # Whether the last frame changed the LEDs
+        self.changed = True
+
+    def get_index_map(self):
+        return get_index_map(self.w, self.h)
+
+    def get_strip_index(self):
+        # Position of every byte sent to the strip in the flattened (w, h, 3)
+        # display colors, covering both the wiring and the channel order
+        return (self.index_map[:, None] * 3 + self.channel_order).ravel()
+
+    def get_lut(self):
+        # None when it would not change any value
+        if self.gamma == 1 and self.brightness == 1:
+            return None
+        levels = np.arange(256) / 255
+        return np.round(255 * self.brightness * levels ** self.gamma).astype(np.uint8)
+
+    def set_gamma(self, gamma):
+        if gamma != self.gamma:
+            self.gamma = gamma
+            self.lut = self.get_lut()
+
+    def set_brightness(self, brightness):
+        if brightness != self.brightness:
+            self.brightness = brightness
+            self.lut = self.get_lut()
+
+    def maximise_colors(self, colors):
+        # In float64 like the per pixel Python arithmetic it replaces, float32
+        # would truncate some bytes one lower
+        max_value = channel_max(colors)[..., None].astype(np.float64)
+        factor = np.divide(255, max_value, out=np.zeros_like(max_value), where=max_value > 0)
+        colors = colors * factor
+        return np.trunc(colors, out=colors)
+
+    def get_display_colors(self, frame):
+        # Returns the frame as (w, h, 3) uint8 rgb colors as the LEDs will show them
+        data = SkyFrame.wrap(frame).data
+        colors = self.maximise_colors(data[..., :3])
+        colors *= data[..., 3:]
+        # Converting to uint8 truncates like np.trunc once clipped
+        np.clip(colors, 0, 255, out=colors)
+        return colors.astype(np.uint8)
+
+    def order_colors(self, colors):
+        # Returns display colors as (n, 3) colors in strip order, with one
+        # gather for wiring and channel order and one lookup for the levels
+        colors = colors.reshape(-1)[self.strip_index]
+        if self.lut is not None:
+            colors = self.lut[colors]
+        return colors.reshape(-1, 3)
+
+    def format_colors(self, frame):
+        return self.order_colors(self.get_display_colors(frame))
+
+    def set_lights(self, frame):
+        start = perf_counter()
+        self.show(self.format_colors(frame), start)
+
+    def show_colors(self, colors):
+        start = perf_counter()
+        self.show(self.order_colors(colors), start)
+
+    def get_changed_ranges(self, colors):
+        # (start, stop) ranges of strip positions whose color changed
+        changed = (colors != self.last_colors).any(axis=-1).astype(np.int8)
+        edges = np.flatnonzero(np.diff(changed, prepend=0, append=0))
+        return list(zip(edges[::2].tolist(), edges[1::2].tolist()))
+
+    def write(self, colors):
+        # Returns False if the LEDs already show colors
+        if self.last_colors is None:
+            self.output.write(colors)
+            self.last_colors = colors.copy()
+            return True
+        if np.array_equal(colors, self.last_colors):
+            return False
+        if self.output.supports_partial:
+            ranges = self.get_changed_ranges(colors)
+            if len(ranges) <= self.max_ranges:
+                self.output.write_ranges(colors, ranges)
             else:
-                led_format.append(reversed(leds[i]))
-        led_final = []
-        for i in range(len(led_format)):
-            for item in led_format[i]:
-                led_final.append(self.format_color(item))
-        for i in range(len(led_final)):
-            self.pixels[i] =led_final[i]
-        self.pixels.show()
+                self.output.write(colors)
+        else:
+            self.output.write(colors)
+        self.last_colors[:] = colors
+        return True
+
+    def show(self, colors, start):
+        # start is when formatting of the frame began
+        changed = self.write(colors)
+        self.changed = changed
+        formatted = perf_counter()
+        if changed:
+            self.output.show()
+        else:
+            self.skipped_frames += 1
+        if self.stats is not None:
+            self.stats.record("format", formatted - start)
+            if changed:
+                self.stats.record("show", perf_counter() - formatted)
 
     def clear_leds(self):
-        self.pixels.fill((0,0,0))
-        self.pixels.show()
+        self.output.clear()
+        self.last_colors = None
+
+    def close(self):
+        self.output.close()
 
     def test_leds(self):
         while(True):
             for x_i in range(self.w):
                 for y_i in range(self.h):
-                    arr = []
-                    for x in range(self.w):
-                        subarr = []
-                        for y in range(self.h):
-                            if x == x_i and y == y_i:
-                                subarr.append(LightSpec((255, 255, 255, 1)))
-                            else:
-                                subarr.append(LightSpec((0, 0, 0, 0)))
-                        arr.append(subarr)
-                    self.set_lights(arr)
+                    frame = SkyFrame(self.w, self.h)
+                    frame.data[x_i, y_i] = (255, 255, 255, 1)
+                    self.set_lights(frame)
                     sleep(0.1)
 
 if __name__ == "main":